@@ -0,0 +1,413 @@
+# ASGI entry point: uvicorn asgi:app --workers N
+#
+# Serves the same endpoints as app.py. Uploads are read without
+# blocking the event loop; cache lookup and decode run on bounded executors
+# and inference goes through the batch scheduler, so one worker keeps many
+# requests in flight. Once ASGI_MAX_PENDING requests are in progress, or the
+# batch queue is full, new requests get 429 instead of queueing. Request
+# bodies are limited while they stream in (see uploads.py).
+import asyncio
+import contextlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.requests import ClientDisconnect
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+import service
+from diseases import parse_fields
+from preprocess import image_source, preprocess_image
+from profiler import profiler_from_env
+from scoring import parse_top_k, select_top_k
+from uploads import UploadConflict, UploadError, UploadTooLarge, body_limit, parse_offset, parse_size
+
+ASGI_MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", str(4 * (os.cpu_count() or 1))))
+
+# Decode on service.decode_pool (threads; Pillow releases the GIL) unless
+# DECODE_PROCESSES asks for a process pool
+DECODE_PROCESSES = int(os.environ.get("DECODE_PROCESSES", "0"))
+decode_executor = ProcessPoolExecutor(DECODE_PROCESSES) if DECODE_PROCESSES > 0 else None
+
+DISEASE_MAX_AGE = 86400
+
+pending = 0
+profiler = None
+
+
+# Same body as Flask's jsonify, which sorts keys
+class SortedJSONResponse(JSONResponse):
+    def render(self, content):
+        return json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def error(message, status_code):
+    headers = {"Retry-After": "1"} if status_code in (429, 503) else None
+    return SortedJSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+
+async def predict(request):
+    return await tracked("/predict", handle_predict, request)
+
+
+async def commit_upload(request):
+    return await tracked("/uploads/commit", handle_commit, request)
+
+
+async def tracked(endpoint, handler, request):
+    global pending
+
+    if pending >= ASGI_MAX_PENDING:
+        return error("Too many requests in progress", 429)
+
+    pending += 1
+    try:
+        with metrics.IN_FLIGHT.labels(endpoint).track_inprogress():
+            if profiler is None:
+                response = await handler(request)
+            else:
+                with profiler.track(endpoint):
+                    response = await handler(request)
+        metrics.REQUESTS.labels(endpoint, str(response.status_code)).inc()
+        return response
+    finally:
+        pending -= 1
+
+
+# Multi-image uploads stream back NDJSON like app.py. predict_many blocks,
+# so the response iterates it on the threadpool; its images go through the
+# batch schedulers, so a full queue answers 429 before streaming starts.
+async def predict_batch(request):
+    global pending
+
+    if pending >= ASGI_MAX_PENDING:
+        return error("Too many requests in progress", 429)
+
+    pending += 1
+    form = None
+    streaming = False
+    try:
+        with metrics.stage("upload_read"):
+            form = await request.form()
+        response = batch_response(request, form)
+        streaming = isinstance(response, StreamingResponse)
+        metrics.REQUESTS.labels("/predict/batch", str(response.status_code)).inc()
+        return response
+    finally:
+        # A streaming response releases both once its stream ends
+        if not streaming:
+            pending -= 1
+            if form is not None:
+                await form.close()
+
+
+def batch_response(request, form):
+    files = [file for file in form.getlist("files") + form.getlist("file") if isinstance(file, UploadFile)]
+    if not files:
+        return error("No file uploaded", 400)
+    options, failed = prediction_options(request)
+    if failed is not None:
+        return failed
+    fields, top_k, crop = options
+    try:
+        service.check_capacity()
+    except service.Overloaded as e:
+        return error(str(e), 429)
+
+    uploads = [(file.filename, file.file) for file in files]
+
+    def lines():
+        for name, result in service.predict_many(service.iter_uploads(uploads), top_k, crop):
+            yield service.diseases.render(result, fields, {"file": name}) + b"\n"
+
+    # Releases the request's slot and spool files however the stream ends:
+    # finished, failed, or closed early by a client disconnect. Starlette
+    # skips a response's background task in the last two cases.
+    async def generate():
+        global pending
+
+        try:
+            with metrics.IN_FLIGHT.labels("/predict/batch").track_inprogress():
+                async for line in iterate_in_threadpool(lines()):
+                    yield line
+        finally:
+            pending -= 1
+            close_files(form)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+# Closes the form's spool files without awaiting, so it also works while
+# the request is being cancelled
+def close_files(form):
+    for _, value in form.multi_items():
+        if isinstance(value, UploadFile):
+            value.file.close()
+
+
+# Parse fields, top_k and crop; returns them, or an error response
+def prediction_options(request):
+    try:
+        options = (
+            parse_fields(request.query_params),
+            parse_top_k(request.query_params),
+            service.crop_index.parse(request.query_params),
+        )
+    except ValueError as e:
+        return None, error(str(e), 400)
+    if not service.models.ready.is_set():
+        return None, error("Model is not ready", 503)
+    return options, None
+
+
+async def handle_predict(request):
+    with metrics.stage("upload_read"):
+        form = await request.form()
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            return error("No file uploaded", 400)
+        options, failed = prediction_options(request)
+        if failed is not None:
+            return failed
+        # Decoded straight from the spooled upload, which the form closes
+        return await predict_upload(file.file, *options)
+    finally:
+        await form.close()
+
+
+# Predict a complete resumable upload from its spool file, then discard it.
+# A 429 or 503 leaves the upload in place so the commit can be retried.
+async def handle_commit(request):
+    options, failed = prediction_options(request)
+    if failed is not None:
+        return failed
+    upload_id = request.path_params["upload_id"]
+    upload = await run_in_threadpool(service.upload_store.open, upload_id)
+    try:
+        response = await predict_upload(upload, *options)
+    finally:
+        await run_in_threadpool(upload.close)
+    if response.status_code == 200:
+        await run_in_threadpool(service.upload_store.discard, upload_id)
+    return response
+
+
+# Predict one upload, given as a seekable binary file
+async def predict_upload(upload, fields, top_k, crop):
+    loop = asyncio.get_running_loop()
+    try:
+        serving, shadowing = service.models.route()
+        image_key, cached = await loop.run_in_executor(
+            service.decode_pool, service.lookup, upload, crop, serving
+        )
+        if cached is not None:
+            metrics.record_result(cached)
+            return prediction_response(select_top_k(cached, top_k), fields)
+
+        if decode_executor is None:
+            img_array = await loop.run_in_executor(service.decode_pool, service.preprocess, upload)
+        else:
+            # Child processes get the bytes. Stage timings from them are
+            # lost, so time the whole hop.
+            with metrics.stage("decode"):
+                img_bytes = await loop.run_in_executor(service.decode_pool, read_upload, upload)
+                img_array = await loop.run_in_executor(decode_executor, preprocess_image, img_bytes)
+
+        with metrics.stage("inference"):
+            future, route, serving = service.submit(img_array, crop, serving)
+            shadow = service.submit_shadow(img_array, crop, shadowing)
+            confidence_scores = await asyncio.wrap_future(future)
+        result = select_top_k(service.finish(image_key, confidence_scores, route, serving, shadow), top_k)
+    except service.Overloaded as e:
+        return error(str(e), 429)
+    except Exception as e:
+        result = {"error": str(e)}
+        metrics.record_result(result)
+    with metrics.stage("serialize"):
+        return prediction_response(result, fields)
+
+
+def prediction_response(result, fields):
+    return Response(service.diseases.render(result, fields), media_type="application/json")
+
+
+def read_upload(upload):
+    return image_source(upload).read()
+
+
+# Resumable uploads (see uploads.UploadStore). The store does blocking file
+# I/O and locking, so every call to it runs on the threadpool.
+async def create_upload(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+    status = await run_in_threadpool(
+        service.upload_store.create, parse_size(body.get("size")), body.get("filename")
+    )
+    return SortedJSONResponse(status, status_code=201, headers={"Location": f"/uploads/{status['upload_id']}"})
+
+
+async def upload_status(request):
+    status = await run_in_threadpool(service.upload_store.status, request.path_params["upload_id"])
+    return SortedJSONResponse(status)
+
+
+# Chunks are written as they arrive. A dropped connection is the normal
+# case on poor networks: what was written stays for the client to resume
+# after, and nobody is left to answer.
+async def append_upload(request):
+    upload_id = request.path_params["upload_id"]
+    offset = parse_offset(request.headers.get("upload-offset"))
+    append = await run_in_threadpool(service.upload_store.appending, upload_id, offset)
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(append.write, chunk)
+    except ClientDisconnect as e:
+        await run_in_threadpool(append.close, e)
+        return Response(status_code=400)
+    except BaseException as e:
+        await run_in_threadpool(append.close, e)
+        raise
+    await run_in_threadpool(append.close)
+    return SortedJSONResponse(await run_in_threadpool(service.upload_store.status, upload_id))
+
+
+async def discard_upload(request):
+    upload_id = request.path_params["upload_id"]
+    await run_in_threadpool(service.upload_store.status, upload_id)
+    await run_in_threadpool(service.upload_store.discard, upload_id)
+    return Response(status_code=204)
+
+
+async def upload_error(request, e):
+    body = {"error": str(e)}
+    if isinstance(e, UploadConflict):
+        body["offset"] = e.offset
+    return SortedJSONResponse(body, status_code=e.status_code)
+
+
+class BodyLimit:
+    # ASGI middleware enforcing uploads.body_limit: a Content-Length over the
+    # limit gets 413 before anything is read, and a body that streams past
+    # it raises UploadTooLarge from receive(), answered 413 by upload_error
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = body_limit(scope["path"])
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            response = error(f"Request body is {int(length)} bytes, limit is {limit}", 413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(f"Request body is over the {limit} byte limit")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def disease_details(request):
+    entry = service.diseases.get(request.path_params["name"])
+    if entry is None:
+        return error(f"Unknown class {request.path_params['name']!r}", 404)
+
+    headers = {"ETag": f'"{entry.etag}"', "Cache-Control": f"public, max-age={DISEASE_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if entry.etag in [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(entry.document, media_type="application/json", headers=headers)
+
+
+async def healthz(request):
+    if service.models.error:
+        return SortedJSONResponse({"status": "error", "error": service.models.error}, status_code=500)
+    return SortedJSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    return SortedJSONResponse(
+        service.models.status(), status_code=200 if service.models.ready.is_set() else 503
+    )
+
+
+async def batching_stats(request):
+    if not service.models.ready.is_set():
+        return error("Model is not ready", 503)
+    return SortedJSONResponse(service.models.primary.scheduler.stats())
+
+
+async def cache_stats(request):
+    return SortedJSONResponse(service.cache.stats())
+
+
+async def model_stats(request):
+    return SortedJSONResponse(service.models.stats())
+
+
+async def specialist_stats(request):
+    return SortedJSONResponse(service.specialists.stats())
+
+
+async def prometheus_metrics(request):
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    if decode_executor is not None:
+        decode_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_app():
+    global profiler
+
+    service.setup()
+    profiler = profiler_from_env()
+    return Starlette(
+        routes=[
+            Route("/predict", predict, methods=["POST"]),
+            Route("/predict/batch", predict_batch, methods=["POST"]),
+            Route("/uploads", create_upload, methods=["POST"]),
+            Route("/uploads/{upload_id}", upload_status, methods=["GET"]),
+            Route("/uploads/{upload_id}", append_upload, methods=["PATCH"]),
+            Route("/uploads/{upload_id}", discard_upload, methods=["DELETE"]),
+            Route("/uploads/{upload_id}/commit", commit_upload, methods=["POST"]),
+            Route("/diseases/{name}", disease_details, methods=["GET"]),
+            Route("/healthz", healthz, methods=["GET"]),
+            Route("/readyz", readyz, methods=["GET"]),
+            Route("/stats/batching", batching_stats, methods=["GET"]),
+            Route("/stats/cache", cache_stats, methods=["GET"]),
+            Route("/stats/models", model_stats, methods=["GET"]),
+            Route("/stats/specialists", specialist_stats, methods=["GET"]),
+            Route("/metrics", prometheus_metrics, methods=["GET"]),
+        ],
+        middleware=[Middleware(BodyLimit)],
+        exception_handlers={UploadError: upload_error},
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
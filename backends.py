@@ -0,0 +1,186 @@
+import threading
+
+import numpy as np
+
+# Default artifact for each backend, as written by model_train.py / export_model.py
+DEFAULT_MODEL_PATHS = {
+    "keras": "model/plant_disease_model.h5",
+    "tflite": "model/plant_disease_model.tflite",
+    "onnx": "model/plant_disease_model.onnx",
+}
+
+
+# Every backend takes a float32 (N, 128, 128, 3) batch and returns (N, classes)
+# softmax scores. Heavy frameworks are imported only by the backend that needs them.
+# Backends that accept `content` can be built from artifact bytes read earlier,
+# e.g. by a preloading parent process. `batch_sizes` lists the batch sizes the
+# caller will mostly use; only backends with fixed-shape tensors need it.
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, path, num_threads=None, content=None, batch_sizes=None):
+        import tensorflow as tf
+
+        if content is not None:
+            raise ValueError("The keras backend loads from a path, not preloaded content")
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        self.path = path
+        self.model = tf.keras.models.load_model(path)
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class TFLiteBackend:
+    name = "tflite"
+
+    # Resizing an interpreter's input reallocates all of its tensors, and the
+    # batch scheduler produces a different batch size nearly every time. So
+    # there is one allocated interpreter per batch size: with `batch_sizes`, a
+    # batch is zero-padded up to the smallest listed size that holds it (and
+    # split at the largest); without, each distinct size gets its own. Built
+    # from a path, each interpreter also holds its own XNNPACK-packed copy of
+    # the weights, which is why the sizes are a few power-of-two buckets (see
+    # batch_buckets).
+
+    def __init__(self, path, num_threads=None, content=None, batch_sizes=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter, OpResolverType
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+            OpResolverType = tf.lite.experimental.OpResolverType
+
+        self.path = path
+        self._Interpreter = Interpreter
+        if content is None:
+            self._options = {"model_path": path, "num_threads": num_threads}
+        else:
+            # Without the default XNNPACK delegate, which packs the weights into
+            # private memory, the builtin kernels read them in place from
+            # `content`: shared by every interpreter here and, when preloaded
+            # before a fork, by every worker
+            self._options = {
+                "model_content": content,
+                "num_threads": num_threads,
+                "experimental_op_resolver_type": OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES,
+            }
+        self.batch_sizes = tuple(sorted(set(batch_sizes))) if batch_sizes else None
+
+        interpreter = self._new_interpreter()
+        self._input = interpreter.get_input_details()[0]
+        self._output = interpreter.get_output_details()[0]
+        self._interpreters = {int(self._input["shape"][0]): interpreter}
+
+        # An interpreter owns mutable tensors and must not be invoked concurrently
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        size = len(batch)
+        if self.batch_sizes is None:
+            return self._invoke(batch)
+
+        largest = self.batch_sizes[-1]
+        if size > largest:
+            return np.concatenate([
+                self.predict(batch[start:start + largest]) for start in range(0, size, largest)
+            ])
+        padded_size = next(n for n in self.batch_sizes if n >= size)
+        if padded_size > size:
+            padding = np.zeros((padded_size - size,) + batch.shape[1:], dtype=np.float32)
+            batch = np.concatenate([batch, padding])
+        return self._invoke(batch)[:size]
+
+    def _invoke(self, batch):
+        with self._lock:
+            interpreter = self._interpreters.get(len(batch))
+            if interpreter is None:
+                interpreter = self._new_interpreter(batch.shape)
+                self._interpreters[len(batch)] = interpreter
+
+            interpreter.set_tensor(self._input["index"], _quantize(batch, self._input))
+            interpreter.invoke()
+            output = interpreter.get_tensor(self._output["index"]).copy()
+        return _dequantize(output, self._output)
+
+    # Resized before the first allocation, so each interpreter allocates once
+    def _new_interpreter(self, input_shape=None):
+        interpreter = self._Interpreter(**self._options)
+        if input_shape is not None:
+            interpreter.resize_tensor_input(self._input["index"], input_shape)
+        interpreter.allocate_tensors()
+        return interpreter
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path, num_threads=None, content=None, batch_sizes=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = ort.InferenceSession(
+            path if content is None else content, options, providers=["CPUExecutionProvider"]
+        )
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+    "onnx": OnnxBackend,
+}
+
+
+# Backends that use bytes read before forking in place, so forked workers
+# share the weights. ONNX Runtime accepts bytes too, but copies the weights
+# into every session.
+PRELOADABLE_BACKENDS = ("tflite",)
+
+
+# Batch sizes to keep interpreters for: powers of two up to the largest
+# batch, so padding at most doubles a batch
+def batch_buckets(max_batch_size):
+    buckets = {max_batch_size}
+    size = 1
+    while size < max_batch_size:
+        buckets.add(size)
+        size *= 2
+    return tuple(sorted(buckets))
+
+
+def load_backend(name, path=None, num_threads=None, content=None, batch_sizes=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](
+        path or DEFAULT_MODEL_PATHS[name], num_threads=num_threads, content=content, batch_sizes=batch_sizes
+    )
+
+
+# Integer-quantized models (full int8 export) take and return quantized tensors
+def _quantize(batch, details):
+    dtype = details["dtype"]
+    if dtype == np.float32:
+        return batch
+    scale, zero_point = details["quantization"]
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output, details):
+    if output.dtype == np.float32:
+        return output
+    scale, zero_point = details["quantization"]
+    return (output.astype(np.float32) - zero_point) * scale
+
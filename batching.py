@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+# Histogram bucket upper bounds
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+INFERENCE_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._count, self._sum
+
+        # Cumulative counts per upper bound, Prometheus style
+        buckets = {}
+        running = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            running += count
+            buckets[str(bound)] = running
+        return {
+            "buckets": buckets,
+            "count": total,
+            "sum": round(value_sum, 3),
+            "mean": round(value_sum / total, 3) if total else 0.0,
+        }
+
+
+# Queued by close() after the last sample
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ("sample", "future", "enqueued_at")
+
+    def __init__(self, sample):
+        self.sample = sample
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class BatchScheduler:
+    # Collects single samples submitted from many request threads and runs them
+    # through `predict_fn` together. A batch is dispatched as soon as it holds
+    # `max_batch_size` samples or the oldest sample has waited `max_wait_ms`.
+    # With `max_queue_size`, submit raises queue.Full instead of letting the
+    # backlog (and so latency) grow without limit.
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0, max_queue_size=0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must not be negative")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000.0
+
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(QUEUE_WAIT_MS_BUCKETS)
+        self.inference_ms = Histogram(INFERENCE_MS_BUCKETS)
+
+        self.max_queue_size = int(max_queue_size)
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, sample):
+        request = _Request(sample)
+        self._queue.put_nowait(request)
+        return request.future
+
+    # True when a submit would raise queue.Full
+    def full(self):
+        return self.max_queue_size > 0 and self._queue.qsize() >= self.max_queue_size
+
+    def predict(self, sample, timeout=None):
+        return self.submit(sample).result(timeout)
+
+    # Stop the worker once every sample submitted before this call has been
+    # predicted. Callers must make sure nothing is submitted afterwards.
+    def close(self):
+        self._queue.put(_STOP)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "inference_ms": self.inference_ms.snapshot(),
+        }
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    # Deadline passed: still sweep up whatever is already queued
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is _STOP:
+                self._stopping = True
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while not self._stopping:
+            batch = self._collect()
+            if batch is None:
+                return
+            dispatched_at = time.monotonic()
+
+            self.batch_sizes.observe(len(batch))
+            for request in batch:
+                self.queue_wait_ms.observe((dispatched_at - request.enqueued_at) * 1000.0)
+
+            try:
+                outputs = self.predict_fn(np.stack([request.sample for request in batch]))
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finally:
+                self.inference_ms.observe((time.monotonic() - dispatched_at) * 1000.0)
+
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output)
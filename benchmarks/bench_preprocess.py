@@ -0,0 +1,92 @@
+"""Compare the legacy decode path with preprocess.preprocess_image.
+
+Usage: python benchmarks/bench_preprocess.py [--repeat N]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocess import IMG_SIZE, preprocess_image  # noqa: E402
+
+# (label, width, height, format)
+CASES = [
+    ("12MP JPEG", 4000, 3000, "JPEG"),
+    ("8MP JPEG", 3264, 2448, "JPEG"),
+    ("2MP JPEG", 1600, 1200, "JPEG"),
+    ("5MP PNG", 2592, 1944, "PNG"),
+    ("VGA JPEG", 640, 480, "JPEG"),
+]
+
+
+def legacy_preprocess(img_bytes):
+    img = Image.open(io.BytesIO(img_bytes)).convert("RGB").resize(IMG_SIZE)
+    return np.array(img) / 255.0
+
+
+# Leaf-ish synthetic photo: green gradients plus noise so JPEG has real detail
+def synthetic_image(width, height, fmt, seed=0):
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    pixels = np.empty((height, width, 3), dtype=np.float32)
+    pixels[..., 0] = 60 + 80 * x * y
+    pixels[..., 1] = 120 + 100 * np.sin(6 * x) * np.cos(4 * y)
+    pixels[..., 2] = 40 + 60 * y
+    pixels += rng.normal(0, 12, size=pixels.shape).astype(np.float32)
+    img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buffer, "JPEG", quality=90)
+    else:
+        img.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def measure(fn, img_bytes, repeat):
+    fn(img_bytes)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(img_bytes)
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    return float(np.median(timings)), fn(img_bytes)
+
+
+# Size of the RGB bitmap Pillow materialises before resizing; Pillow allocates
+# it in C, so tracemalloc cannot see it
+def decoded_mb(img_bytes, draft):
+    img = Image.open(io.BytesIO(img_bytes))
+    if draft and img.format == "JPEG":
+        img.draft("RGB", IMG_SIZE)
+    width, height = img.size
+    return width * height * 3 / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'case':<12} {'size':>8} {'legacy ms':>10} {'fast ms':>9} {'speedup':>8} "
+          f"{'legacy MB':>10} {'fast MB':>8} {'mean |diff|':>12}")
+    for label, width, height, fmt in CASES:
+        img_bytes = synthetic_image(width, height, fmt)
+        legacy_ms, legacy_out = measure(legacy_preprocess, img_bytes, args.repeat)
+        fast_ms, fast_out = measure(preprocess_image, img_bytes, args.repeat)
+        legacy_mb, fast_mb = decoded_mb(img_bytes, False), decoded_mb(img_bytes, True)
+        diff = float(np.abs(legacy_out - fast_out).mean())
+        print(f"{label:<12} {len(img_bytes) / 1e6:>6.1f}MB {legacy_ms:>10.1f} {fast_ms:>9.1f} "
+              f"{legacy_ms / fast_ms:>7.1f}x {legacy_mb:>10.1f} {fast_mb:>8.1f} {diff:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
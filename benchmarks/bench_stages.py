@@ -0,0 +1,114 @@
+"""Time each stage of service.predict_disease in isolation.
+
+Usage: python benchmarks/bench_stages.py [--repeat 20] [--output stages.json]
+
+Uses the random stand-in model (benchmarks/standin.py), so it runs without
+trained weights. Inference numbers therefore only cover the batch
+scheduler's overhead, not a real forward pass.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import standin  # noqa: E402
+
+standin.register()
+
+import service  # noqa: E402
+from bench_preprocess import synthetic_image  # noqa: E402
+from cache import PredictionCache  # noqa: E402
+from load_test import IMAGE_MIX  # noqa: E402
+from preprocess import IMG_SIZE, check_size, decode_image, resize_image, to_array  # noqa: E402
+from model_manager import ModelManager  # noqa: E402
+from runtime import ModelRuntime  # noqa: E402
+
+
+def measure(fn, repeat):
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "median_ms": round(float(np.median(timings)), 4),
+        "p95_ms": round(float(np.percentile(timings, 95)), 4),
+    }
+
+
+def stage_benchmarks(img_bytes, repeat):
+    # Each stage gets the previous stage's output, computed once up front
+    cache_key = service.cache.key(img_bytes)
+    img = decode_image(io.BytesIO(img_bytes))
+    resized = resize_image(img)
+    img_array = to_array(resized)
+    batch = img_array[np.newaxis]
+    scores = service.models.primary.model.predict(batch)[0]
+    result = service.build_result(scores)
+    fresh = iter(range(10 ** 9))
+
+    return {
+        "cache_key": measure(lambda: service.cache.key(img_bytes), repeat),
+        "cache_lookup": measure(lambda: service.cache.get(cache_key), repeat),
+        "check_size": measure(lambda: check_size(img_bytes), repeat),
+        "decode": measure(lambda: decode_image(io.BytesIO(img_bytes)), repeat),
+        "resize": measure(lambda: resize_image(img), repeat),
+        "to_array": measure(lambda: to_array(resized), repeat),
+        "model_predict": measure(lambda: service.models.primary.model.predict(batch), repeat),
+        "scheduled_predict": measure(lambda: service.submit(img_array)[0].result(), repeat),
+        "build_result": measure(lambda: service.build_result(scores), repeat),
+        "render": measure(lambda: service.diseases.render(result), repeat),
+        "render_lite": measure(lambda: service.diseases.render(result, ()), repeat),
+        # Trailing bytes change the cache key without changing the image
+        "predict_disease": measure(
+            lambda: service.predict_disease(img_bytes + str(next(fresh)).encode()), repeat
+        ),
+        "predict_disease_cached": measure(lambda: service.predict_disease(img_bytes), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch-max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args()
+
+    service.models = ModelManager(
+        lambda path: ModelRuntime(
+            backend_name=standin.NAME, model_path=path, batch_max_wait_ms=args.batch_max_wait_ms,
+            warmup_batch_sizes=(1,),
+        ),
+        standin.MODEL_PATH,
+        watch_interval=0,
+    )
+    service.models.primary.start(background=False)
+    service.cache = PredictionCache([standin.MODEL_PATH, service.CLASS_INDICES_PATH])
+
+    results = {}
+    for label, width, height, fmt, _ in IMAGE_MIX:
+        img_bytes = synthetic_image(width, height, fmt)
+        results[label] = stage_benchmarks(img_bytes, args.repeat)
+
+    stages = list(next(iter(results.values())))
+    print(f"median ms, input {IMG_SIZE[0]}x{IMG_SIZE[1]}")
+    print(f"{'stage':<24}" + "".join(f"{label:>12}" for label in results))
+    for name in stages:
+        print(f"{name:<24}" + "".join(f"{results[label][name]['median_ms']:>12.3f}" for label in results))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"repeat": args.repeat, "batch_max_wait_ms": args.batch_max_wait_ms,
+                       "stages": results}, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Accuracy parity and latency/throughput comparison across model backends.
+
+Usage: python benchmarks/compare_backends.py [--backends keras,tflite,onnx]
+       [--dataset dataset] [--samples 500] [--min-agreement 0.99]
+
+The first backend is the reference. Exits non-zero when another backend's
+top-1 agreement with it falls below --min-agreement.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DEFAULT_MODEL_PATHS, load_backend  # noqa: E402
+from preprocess import IMG_SIZE  # noqa: E402
+from samples import load_samples, sample_dataset  # noqa: E402
+
+
+def predict_all(backend, images, batch_size=32):
+    return np.concatenate([
+        backend.predict(images[start:start + batch_size])
+        for start in range(0, len(images), batch_size)
+    ])
+
+
+def latency(backend, images, batch_size, repeat):
+    batch = images[:batch_size]
+    if len(batch) < batch_size:
+        batch = np.resize(images, (batch_size,) + images.shape[1:])
+    backend.predict(batch)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.predict(batch)
+        timings.append(time.perf_counter() - start)
+    median = float(np.median(timings))
+    return median * 1000.0, batch_size / median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="keras,tflite,onnx",
+                        help="comma separated, optionally name=path; the first is the reference")
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    with open("model/class_indices.json", "r") as f:
+        class_ids = {name: int(index) for index, name in json.load(f).items()}
+
+    if os.path.isdir(args.dataset):
+        samples = sample_dataset(args.dataset, args.samples)
+        images = load_samples(samples)
+        labels = np.array([class_ids.get(class_name, -1) for _, class_name in samples])
+    else:
+        print(f"{args.dataset} not found, using random images (accuracy not reported)")
+        rng = np.random.default_rng(0)
+        images = rng.random((args.samples, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+        labels = None
+
+    backends = []
+    for spec in args.backends.split(","):
+        name, _, path = spec.partition("=")
+        path = path or DEFAULT_MODEL_PATHS[name]
+        if not os.path.exists(path):
+            print(f"skipping {name}: {path} not found")
+            continue
+        backends.append(load_backend(name, path))
+    if not backends:
+        parser.error("No backend artifacts found")
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    reference = predict_all(backends[0], images)
+    reference_top1 = reference.argmax(axis=1)
+    failed = False
+
+    print(f"\n{'backend':<8} {'size MB':>8} {'agree':>7} {'max|dp|':>8} {'acc':>7}  "
+          + "  ".join(f"{'b=' + str(size) + ' ms':>10} {'img/s':>8}" for size in batch_sizes))
+    for backend in backends:
+        scores = reference if backend is backends[0] else predict_all(backend, images)
+        top1 = scores.argmax(axis=1)
+        agreement = float((top1 == reference_top1).mean())
+        max_diff = float(np.abs(scores - reference).max())
+        accuracy = f"{float((top1 == labels).mean()):.4f}" if labels is not None else "-"
+        timings = [latency(backend, images, size, args.repeat) for size in batch_sizes]
+
+        print(f"{backend.name:<8} {os.path.getsize(backend.path) / 1e6:>8.1f} {agreement:>7.4f} "
+              f"{max_diff:>8.4f} {accuracy:>7}  "
+              + "  ".join(f"{ms:>10.2f} {rate:>8.1f}" for ms, rate in timings))
+        if agreement < args.min_agreement:
+            failed = True
+
+    if failed:
+        print(f"\nParity check failed: top-1 agreement below {args.min_agreement}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""Load test /predict and report latency percentiles, throughput and memory.
+
+Usage: python benchmarks/load_test.py [--url http://127.0.0.1:8000]
+       [--concurrency 8 | --rate 50] [--duration 30] [--output results.json]
+
+Without --url the Flask app is driven in process through its test client,
+using the random stand-in model (benchmarks/standin.py), so no trained
+weights are needed. With --url any running server is driven over HTTP;
+pass --server-pid (e.g. the gunicorn master) to report the peak RSS of it
+and every worker.
+
+--concurrency runs a closed loop: each client sends its next request when
+the previous one returns. --rate runs an open loop: requests are started on
+a fixed (or --poisson) schedule whether or not earlier ones finished, and
+latency is measured from the scheduled start, so a stalled server shows up
+in the tail instead of silently lowering the offered load.
+
+Every upload gets a few random bytes appended after the image data, which
+decoders ignore, so the server's prediction cache never answers for it;
+--allow-cache-hits sends the pooled images unchanged.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_preprocess import synthetic_image  # noqa: E402
+
+# (label, width, height, format, weight): the kind of uploads the app gets,
+# mostly phone photos with some screenshots and pre-shrunk images
+IMAGE_MIX = [
+    ("12MP JPEG", 4000, 3000, "JPEG", 2),
+    ("3MP JPEG", 2048, 1536, "JPEG", 4),
+    ("VGA JPEG", 640, 480, "JPEG", 2),
+    ("1MP PNG", 1024, 768, "PNG", 1),
+    ("1MP WEBP", 1280, 960, "WEBP", 1),
+]
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+# --- Workload -----------------------------------------------------------------
+
+class ImagePool:
+    # A few distinct images per kind, drawn according to the mix weights
+
+    def __init__(self, variants, allow_cache_hits=False, seed=0):
+        self.allow_cache_hits = allow_cache_hits
+        self.images = []
+        self.weights = []
+        for label, width, height, fmt, weight in IMAGE_MIX:
+            for variant in range(variants):
+                img_bytes = synthetic_image(width, height, fmt, seed=seed + variant)
+                self.images.append((label, f"leaf{variant}.{fmt.lower()}", CONTENT_TYPES[fmt], img_bytes))
+                self.weights.append(weight)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            label, filename, content_type, img_bytes = self._random.choices(self.images, self.weights)[0]
+        if not self.allow_cache_hits:
+            img_bytes += os.urandom(16)
+        return label, filename, content_type, img_bytes
+
+    def describe(self):
+        sizes = {}
+        for label, _, _, img_bytes in self.images:
+            sizes.setdefault(label, []).append(len(img_bytes))
+        return {label: round(sum(values) / len(values) / 1e6, 3) for label, values in sizes.items()}
+
+
+# --- Targets ------------------------------------------------------------------
+
+class HttpTarget:
+    # Keep-alive connection per client thread
+
+    def __init__(self, url, path):
+        parsed = urllib.parse.urlsplit(url)
+        self.scheme = parsed.scheme or "http"
+        self.netloc = parsed.netloc
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            connection = self._local.connection = cls(self.netloc, timeout=60)
+        return connection
+
+    def get(self, path):
+        connection = self._connection()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            connection.close()
+            raise
+
+    def post(self, filename, content_type, img_bytes):
+        boundary = uuid.uuid4().hex
+        body = b"".join([
+            f"--{boundary}\r\n".encode(),
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+            f"Content-Type: {content_type}\r\n\r\n".encode(),
+            img_bytes,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        connection = self._connection()
+        try:
+            connection.request("POST", self.path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            connection.close()
+            raise
+
+
+class InProcessTarget:
+    # The Flask app through its test client, backed by the stand-in model
+
+    def __init__(self, path, model_delay_ms):
+        import standin
+
+        standin.register(model_delay_ms)
+        os.environ["MODEL_BACKEND"] = standin.NAME
+        import app as app_module
+
+        self.client = app_module.app.test_client()
+        self.path = path
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, filename, content_type, img_bytes):
+        response = self.client.post(
+            self.path,
+            data={"file": (io.BytesIO(img_bytes), filename, content_type)},
+            content_type="multipart/form-data",
+        )
+        response.get_data()
+        return response.status_code
+
+
+def wait_ready(target, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if target.get("/readyz") == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit(f"Server not ready after {timeout:.0f}s")
+        time.sleep(0.2)
+
+
+# --- Load generation ----------------------------------------------------------
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, label, started_at, status=None, error=None):
+        latency_ms = (time.perf_counter() - started_at) * 1000.0
+        with self._lock:
+            if error is not None:
+                self.errors[error] += 1
+                return
+            self.statuses[str(status)] += 1
+            if status == 200:
+                self.latencies.setdefault(label, []).append(latency_ms)
+
+
+def send(target, pool, recorder, started_at=None):
+    label, filename, content_type, img_bytes = pool.next()
+    if started_at is None:
+        started_at = time.perf_counter()
+    try:
+        status = target.post(filename, content_type, img_bytes)
+    except Exception as e:
+        recorder.record(label, started_at, error=type(e).__name__)
+    else:
+        recorder.record(label, started_at, status)
+
+
+def closed_loop(target, pool, recorder, concurrency, duration, max_requests):
+    deadline = time.perf_counter() + duration
+    remaining = [max_requests]
+    lock = threading.Lock()
+
+    def client():
+        while time.perf_counter() < deadline:
+            if max_requests:
+                with lock:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            send(target, pool, recorder)
+
+    threads = [threading.Thread(target=client, name=f"client-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def open_loop(target, pool, recorder, rate, duration, max_requests, max_in_flight, poisson, seed=0):
+    rng = random.Random(seed)
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="client") as executor:
+        start = time.perf_counter()
+        scheduled_at = start
+        sent = 0
+        while scheduled_at - start < duration and (not max_requests or sent < max_requests):
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Queueing in the executor counts towards latency
+            executor.submit(send, target, pool, recorder, scheduled_at)
+            sent += 1
+            scheduled_at += rng.expovariate(rate) if poisson else 1.0 / rate
+
+
+# --- Reporting ----------------------------------------------------------------
+
+def summarize(latencies):
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def _proc_status(pid):
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = value.strip()
+    return fields
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces; the parent PID follows it
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+# Peak (VmHWM) and current RSS of a server process and all its descendants
+def server_memory(pid):
+    processes = {}
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        try:
+            status = _proc_status(current)
+        except OSError:
+            continue
+        processes[str(current)] = {
+            "name": status.get("Name"),
+            "peak_rss_mb": round(int(status.get("VmHWM", "0 kB").split()[0]) / 1024, 1),
+            "rss_mb": round(int(status.get("VmRSS", "0 kB").split()[0]) / 1024, 1),
+        }
+        todo += _children(current)
+    return processes
+
+
+def report(results):
+    overall = results["latency"]
+    print(f"{results['requests']} requests in {results['elapsed_seconds']:.1f}s: "
+          f"{results['requests_per_second']:.1f} req/s, {results['successes_per_second']:.1f} ok/s")
+    print(f"status {dict(results['statuses'])} errors {dict(results['errors'])}")
+    print(f"{'images':<12} {'count':>7} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for label, stats in [("all", overall)] + sorted(results["latency_by_image"].items()):
+        if stats["count"]:
+            print(f"{label:<12} {stats['count']:>7} {stats['mean_ms']:>8.1f} {stats['p50_ms']:>8.1f} "
+                  f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+    for pid, memory in results["memory"].items():
+        print(f"pid {pid:<8} {memory.get('name') or '':<16} peak RSS {memory['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="server to drive; default is the Flask app in process")
+    parser.add_argument("--path", default="/predict", help="endpoint, with any query, e.g. /predict?lite=1")
+    parser.add_argument("--concurrency", type=int, default=8, help="closed-loop clients")
+    parser.add_argument("--rate", type=float, help="open-loop requests/sec; overrides --concurrency")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times for --rate")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="open-loop client threads")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent first and not measured")
+    parser.add_argument("--variants", type=int, default=3, help="distinct images per kind in the mix")
+    parser.add_argument("--allow-cache-hits", action="store_true")
+    parser.add_argument("--model-delay-ms", type=float, default=0.0,
+                        help="in-process only: per-batch sleep added to the stand-in model")
+    parser.add_argument("--server-pid", type=int, help="report peak RSS of this process and its children")
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the results as JSON here")
+    args = parser.parse_args()
+
+    if args.url:
+        target = HttpTarget(args.url, args.path)
+    else:
+        target = InProcessTarget(args.path, args.model_delay_ms)
+    wait_ready(target, args.ready_timeout)
+
+    print("Generating images...")
+    pool = ImagePool(args.variants, args.allow_cache_hits)
+
+    warmup = Recorder()
+    for _ in range(args.warmup):
+        send(target, pool, warmup)
+
+    recorder = Recorder()
+    started_at = time.perf_counter()
+    if args.rate:
+        open_loop(target, pool, recorder, args.rate, args.duration, args.requests,
+                  args.max_in_flight, args.poisson)
+    else:
+        closed_loop(target, pool, recorder, args.concurrency, args.duration, args.requests)
+    elapsed = time.perf_counter() - started_at
+
+    if args.server_pid:
+        memory = server_memory(args.server_pid)
+    else:
+        # ru_maxrss is in kilobytes on Linux; the in-process server is this process
+        memory = {str(os.getpid()): {
+            "name": "in-process" if not args.url else "client",
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }}
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    requests = sum(recorder.statuses.values()) + sum(recorder.errors.values())
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "target": args.url or "in-process",
+            "path": args.path,
+            "mode": "open" if args.rate else "closed",
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "poisson": args.poisson if args.rate else None,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "allow_cache_hits": args.allow_cache_hits,
+            "model_delay_ms": None if args.url else args.model_delay_ms,
+            "image_mb": pool.describe(),
+        },
+        "host": {"cpu_count": os.cpu_count(), "python": platform.python_version(), "machine": platform.machine()},
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 2),
+        "successes_per_second": round(len(all_latencies) / elapsed, 2),
+        "statuses": dict(recorder.statuses),
+        "errors": dict(recorder.errors),
+        "latency": summarize(all_latencies),
+        "latency_by_image": {label: summarize(values) for label, values in recorder.latencies.items()},
+        "memory": memory,
+    }
+    report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
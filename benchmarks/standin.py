@@ -0,0 +1,59 @@
+"""Tiny randomly initialised stand-in for the trained model.
+
+Lets the benchmarks exercise the full request path without trained weights:
+`register()` adds it to backends.BACKENDS as the "standin" backend, which the
+service then loads like any other (MODEL_BACKEND=standin).
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backends  # noqa: E402
+
+NAME = "standin"
+# Never read; only part of the prediction cache fingerprint
+MODEL_PATH = "model/standin"
+
+
+def _num_classes():
+    with open("model/class_indices.json", "r") as f:
+        return len(json.load(f))
+
+
+class StandInBackend:
+    # 8x8 average pool, then two random dense layers and a softmax. Logits
+    # are scaled up so some predictions clear the confidence threshold and
+    # both the named-class and the Unknown paths are exercised. `delay_ms`
+    # adds a fixed per-batch sleep to mimic a real model's forward pass.
+    name = NAME
+    delay_ms = 0.0
+    seed = 0
+
+    def __init__(self, path, num_threads=None, content=None, batch_sizes=None):
+        self.path = path
+        rng = np.random.default_rng(self.seed)
+        self.w1 = rng.normal(0, 0.1, size=(16 * 16 * 3, 64)).astype(np.float32)
+        self.w2 = rng.normal(0, 1.0, size=(64, _num_classes())).astype(np.float32)
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        n, height, width, channels = batch.shape
+        pooled = batch.reshape(n, 16, height // 16, 16, width // 16, channels).mean(axis=(2, 4))
+        hidden = np.maximum(pooled.reshape(n, -1) @ self.w1, 0.0)
+        logits = 20.0 * (hidden @ self.w2)
+        logits -= logits.max(axis=1, keepdims=True)
+        scores = np.exp(logits)
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000.0)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+
+def register(delay_ms=0.0):
+    StandInBackend.delay_ms = delay_ms
+    backends.BACKENDS[NAME] = StandInBackend
+    backends.DEFAULT_MODEL_PATHS[NAME] = MODEL_PATH
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# How often the model files are re-checked for changes
+VERSION_CHECK_INTERVAL = 1.0
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# How often each process sweeps expired and surplus rows from the SQLite tier
+DISK_SWEEP_INTERVAL = 60.0
+
+
+# Fingerprint of the files a prediction depends on; changes whenever any of
+# them is replaced or rewritten. A directory counts the files in it, since
+# its own mtime does not change when one of them is rewritten in place.
+def file_fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+            if os.path.isdir(path):
+                for entry in sorted(os.scandir(path), key=lambda entry: entry.name):
+                    if entry.is_file():
+                        stat = entry.stat()
+                        digest.update(f"{entry.path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            digest.update(f"{path}:missing;".encode())
+    return digest.hexdigest()[:16]
+
+
+# SHA-256 of an upload given as bytes or as a seekable binary file, which is
+# hashed in chunks from the start and left rewound
+def content_digest(upload):
+    if isinstance(upload, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(upload).hexdigest()
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(HASH_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    # Two-tier cache of prediction results keyed by the SHA-256 of the raw
+    # upload plus the model version. The in-process tier is a bounded LRU with
+    # a TTL; the optional SQLite tier survives restarts and is shared by all
+    # workers on the host. Its rows record the model version that produced
+    # them, and `retain_model_versions` deletes those of versions no longer
+    # served. It is also swept periodically: expired rows are deleted, then
+    # the rows closest to expiry until at most `disk_max_entries` are left.
+
+    def __init__(self, watched_paths, max_entries=2048, ttl_seconds=86400, db_path=None,
+                 disk_max_entries=100000):
+        self.watched_paths = list(watched_paths)
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl_seconds)
+        self.disk_max_entries = int(disk_max_entries)
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "disk_expirations": 0,
+            "disk_evictions": 0,
+            "disk_invalidations": 0,
+        }
+
+        # The SQLite connection is opened lazily per process, since a
+        # connection must not be shared across a fork
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+        self._swept_at = time.monotonic()
+
+        self.version = file_fingerprint(self.watched_paths)
+        self._checked_at = time.monotonic()
+
+    def key(self, upload):
+        self._check_version()
+        return f"{self.version}:{content_digest(upload)}"
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return result
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+        result = self._disk_get(key, now)
+        with self._lock:
+            if result is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._store(key, result, now + self.ttl)
+        return result
+
+    # `model_version` is the version of the model that produced the result
+    def put(self, key, result, model_version=None):
+        # Results computed against labels or scoring config that have since changed are dropped
+        if not key.startswith(self.version + ":"):
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, result, expires_at)
+        self._disk_put(key, result, expires_at, model_version)
+
+    # Delete the disk rows of every model version but `model_versions`, e.g.
+    # after a hot swap. In memory, old versions' entries are never looked up
+    # again and fall out of the LRU.
+    def retain_model_versions(self, model_versions):
+        if not self.db_path:
+            return
+        model_versions = list(model_versions)
+        placeholders = ",".join("?" * len(model_versions))
+        with self._lock:
+            deleted = self._connection().execute(
+                f"DELETE FROM predictions WHERE model_version IS NULL OR model_version NOT IN ({placeholders})",
+                model_versions,
+            ).rowcount
+            self._counters["disk_invalidations"] += deleted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM predictions")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        return {
+            "version": self.version,
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk": bool(self.db_path),
+            "disk_max_entries": self.disk_max_entries,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            **counters,
+        }
+
+    def _connection(self):
+        if not self.db_path:
+            return None
+        if self._db_pid != os.getpid():
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                "result TEXT NOT NULL, expires_at REAL NOT NULL, model_version TEXT)"
+            )
+            # Added after the table was first released
+            columns = [row[1] for row in db.execute("PRAGMA table_info(predictions)")]
+            if "model_version" not in columns:
+                db.execute("ALTER TABLE predictions ADD COLUMN model_version TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS predictions_expires_at ON predictions (expires_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS predictions_model_version ON predictions (model_version)")
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _store(self, key, result, expires_at):
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+
+        version = file_fingerprint(self.watched_paths)
+        if version == self.version:
+            return
+        with self._lock:
+            self.version = version
+            self._entries.clear()
+            self._counters["invalidations"] += 1
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM predictions WHERE version != ?", (version,))
+
+    def _disk_get(self, key, now):
+        if not self.db_path:
+            return None
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT result, expires_at FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                self._connection().execute("DELETE FROM predictions WHERE key = ?", (key,))
+                self._counters["disk_expirations"] += 1
+        if row is None or row[1] <= now:
+            return None
+        return json.loads(row[0])
+
+    def _disk_put(self, key, result, expires_at, model_version):
+        if not self.db_path:
+            return
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO predictions (key, version, result, expires_at, model_version) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, self.version, json.dumps(result), expires_at, model_version),
+            )
+            if time.monotonic() - self._swept_at >= DISK_SWEEP_INTERVAL:
+                self._sweep()
+
+    # Delete expired rows, then the ones closest to expiry beyond the cap.
+    # Called with the lock held.
+    def _sweep(self):
+        self._swept_at = time.monotonic()
+        db = self._connection()
+        expired = db.execute("DELETE FROM predictions WHERE expires_at <= ?", (time.time(),)).rowcount
+        self._counters["disk_expirations"] += expired
+        surplus = db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.disk_max_entries
+        if surplus > 0:
+            db.execute(
+                "DELETE FROM predictions WHERE key IN "
+                "(SELECT key FROM predictions ORDER BY expires_at LIMIT ?)",
+                (surplus,),
+            )
+            self._counters["disk_evictions"] += surplus
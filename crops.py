@@ -0,0 +1,273 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from backends import DEFAULT_MODEL_PATHS, batch_buckets, load_backend
+from batching import BatchScheduler
+from cache import VERSION_CHECK_INTERVAL, file_fingerprint
+from preprocess import IMG_SIZE
+from scoring import UNKNOWN_CLASS
+
+logger = logging.getLogger(__name__)
+
+# Per-crop specialists written by `model_train.py --per-crop`: <crop>.json
+# (the classes, in the specialist's output order) next to the model artifact
+SPECIALIST_DIR = "model/crops"
+
+# Below this share of the full model's probability on the hinted crop's
+# classes, a masked prediction falls back to unknown
+CROP_MIN_MASS = float(os.environ.get("CROP_MIN_MASS", "0.2"))
+
+
+# Short, case-insensitive crop key of a class name:
+# "Corn_(maize)___Common_rust_" -> "corn", "Pepper,_bell___healthy" -> "pepper"
+def crop_key(name):
+    crop = name.split("___")[0]
+    for separator in ("_(", ","):
+        crop = crop.split(separator)[0]
+    return crop.strip("_").lower()
+
+
+class CropIndex:
+    # Which class IDs belong to each crop. The model's own unknown class, if
+    # it has one, belongs to every crop so off-crop images can still land there.
+
+    def __init__(self, class_labels):
+        self.num_classes = len(class_labels)
+        unknown = [int(i) for i, name in class_labels.items() if name.lower() == UNKNOWN_CLASS]
+        self.classes = {}
+        for class_id, name in class_labels.items():
+            if name.lower() != UNKNOWN_CLASS:
+                self.classes.setdefault(crop_key(name), []).append(int(class_id))
+        for crop in self.classes:
+            self.classes[crop] = sorted(self.classes[crop] + unknown)
+
+        self.masks = {}
+        for crop, class_ids in self.classes.items():
+            mask = np.zeros(self.num_classes, dtype=np.float64)
+            mask[class_ids] = 1.0
+            self.masks[crop] = mask
+
+    # Parse ?crop= from query arguments; None when absent. Raises ValueError.
+    def parse(self, args):
+        value = args.get("crop")
+        if not value:
+            return None
+        crop = crop_key(value)
+        if crop not in self.classes:
+            raise ValueError(f"Unknown crop {value!r}, expected one of {sorted(self.classes)}")
+        return crop
+
+
+class Route:
+    # How the scores of one prediction were produced: the full model
+    # (crop None), the full model masked to a crop, or a crop's specialist.
+    # Scores are always full width; `temperature` None means the service's.
+    __slots__ = ("crop", "kind", "mask", "min_mass", "temperature")
+
+    def __init__(self, crop=None, kind="full", mask=None, min_mass=0.0, temperature=None):
+        self.crop = crop
+        self.kind = kind
+        self.mask = mask
+        self.min_mass = min_mass
+        self.temperature = temperature
+
+
+FULL_ROUTE = Route()
+
+
+class Specialist:
+    # A loaded crop model with its own batch scheduler. Its outputs are
+    # scattered into full-width score rows so scoring does not change; the
+    # route's mask keeps other classes out of the alternatives.
+
+    def __init__(self, crop, model, class_ids, num_classes, temperature, size_bytes, scheduler_options,
+                 paths=(), version=None):
+        self.crop = crop
+        self.model = model
+        # Its files and their fingerprint when loaded, to notice a replacement
+        self.paths = list(paths)
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.class_ids = np.asarray(class_ids)
+        self.num_classes = num_classes
+        self.size_bytes = size_bytes
+        mask = np.zeros(num_classes, dtype=np.float64)
+        mask[self.class_ids] = 1.0
+        self.route = Route(crop, "specialist", mask, temperature=temperature)
+        self.scheduler = BatchScheduler(self.predict, **scheduler_options)
+
+    def predict(self, batch):
+        scores = np.asarray(self.model.predict(batch))
+        full = np.zeros((len(scores), self.num_classes), dtype=np.float64)
+        full[:, self.class_ids] = scores
+        return full
+
+
+class SpecialistRegistry:
+    # Lazily loaded per-crop specialists. A crop's specialist is loaded (and
+    # warmed up) in the background the first time it is asked for; until then (or when it has
+    # none) requests use the full model masked to the crop, so no request
+    # waits for a load. Loaded specialists are kept in LRU order and the least
+    # recently used are evicted once their artifacts add up to more than
+    # `memory_budget_mb` (artifact size is the estimate of resident weights).
+    # A loaded specialist whose files are replaced is reloaded the same way,
+    # serving the old version until the new one is ready.
+
+    def __init__(self, backend_name, class_labels, crop_index, specialist_dir=SPECIALIST_DIR,
+                 memory_budget_mb=256, num_threads=None, scheduler_options=None):
+        self.backend_name = backend_name
+        self.crop_index = crop_index
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.num_threads = num_threads
+        self.scheduler_options = scheduler_options or {}
+
+        self.class_ids = {name: int(class_id) for class_id, name in class_labels.items()}
+        self.extension = os.path.splitext(DEFAULT_MODEL_PATHS[backend_name])[1]
+        self.available = {}
+        for config_path in sorted(glob.glob(os.path.join(specialist_dir, "*.json"))):
+            if not os.path.exists(self._model_path(config_path)):
+                continue
+            try:
+                spec = self._read_spec(config_path)
+            except ValueError as e:
+                logger.warning("Skipping specialist %s: %s", config_path, e)
+                continue
+            self.available[spec["crop"]] = spec
+
+        self._loaded = OrderedDict()
+        self._loading = set()
+        self._lock = threading.Lock()
+        self._counters = {"loads": 0, "load_errors": 0, "evictions": 0}
+
+    # Submit one image to the crop's specialist; returns (future, route), or
+    # None when it is not loaded and the full model should be masked instead
+    def submit(self, crop, img_array):
+        with self._lock:
+            specialist = self._get(crop)
+            if specialist is None:
+                return None
+            # Under the lock, so eviction cannot close the scheduler in between
+            return specialist.scheduler.submit(img_array), specialist.route
+
+    # The loaded specialist for `crop`, or None (starting a load if it has one)
+    def get(self, crop):
+        with self._lock:
+            return self._get(crop)
+
+    def _model_path(self, config_path):
+        return os.path.splitext(config_path)[0] + self.extension
+
+    def _read_spec(self, config_path):
+        with open(config_path, "r") as f:
+            config = json.load(f)
+        unknown = [name for name in config["classes"] if name not in self.class_ids]
+        if unknown:
+            raise ValueError(f"classes {unknown} are not model classes")
+        return {
+            "crop": config["crop"],
+            "config_path": config_path,
+            "path": self._model_path(config_path),
+            "class_ids": [self.class_ids[name] for name in config["classes"]],
+            "temperature": float(config.get("temperature", 1.0)),
+        }
+
+    def masked_route(self, crop):
+        return Route(crop, "masked", self.crop_index.masks[crop], CROP_MIN_MASS)
+
+    def _get(self, crop):
+        specialist = self._loaded.get(crop)
+        if specialist is not None:
+            self._loaded.move_to_end(crop)
+            self._check_version(specialist)
+            return specialist
+        if crop in self.available and crop not in self._loading:
+            self._start_load(crop)
+        return None
+
+    def _start_load(self, crop):
+        self._loading.add(crop)
+        threading.Thread(target=self._load, args=(crop,), name=f"specialist-{crop}", daemon=True).start()
+
+    # Reload a specialist whose files changed; checked at most once a second
+    def _check_version(self, specialist):
+        now = time.monotonic()
+        if now - specialist.checked_at < VERSION_CHECK_INTERVAL or specialist.crop in self._loading:
+            return
+        specialist.checked_at = now
+        if file_fingerprint(specialist.paths) != specialist.version:
+            self._start_load(specialist.crop)
+
+    def _load(self, crop):
+        config_path = self.available[crop]["config_path"]
+        paths = [config_path, self._model_path(config_path)]
+        # Fingerprint before reading, so a write during the load shows up as a change
+        version = file_fingerprint(paths)
+        try:
+            spec = self._read_spec(config_path)
+            model = load_backend(
+                self.backend_name, spec["path"], self.num_threads,
+                batch_sizes=batch_buckets(self.scheduler_options.get("max_batch_size", 16)),
+            )
+            model.predict(np.zeros((1, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32))
+            specialist = Specialist(
+                crop, model, spec["class_ids"], self.crop_index.num_classes, spec["temperature"],
+                os.path.getsize(spec["path"]), self.scheduler_options, paths, version,
+            )
+        except Exception:
+            logger.exception("Failed to load the %s specialist %s", crop, paths[1])
+            with self._lock:
+                self._loading.discard(crop)
+                self._counters["load_errors"] += 1
+                current = self._loaded.get(crop)
+                if current is not None:
+                    # Keep serving the loaded version; retried when the files change again
+                    current.version = version
+                else:
+                    # Do not retry a broken artifact on every request
+                    self.available.pop(crop, None)
+            return
+
+        with self._lock:
+            self._loading.discard(crop)
+            replaced = self._loaded.pop(crop, None)
+            self._loaded[crop] = specialist
+            self._counters["loads"] += 1
+            evicted = self._evict()
+        logger.info("Loaded the %s specialist %s", crop, paths[1])
+        # Submits happen under the lock, so nothing reaches these schedulers any more
+        if replaced is not None:
+            replaced.scheduler.close()
+            logger.info("Replaced the %s specialist", crop)
+        for old in evicted:
+            old.scheduler.close()
+            logger.info("Evicted the %s specialist", old.crop)
+
+    def _evict(self):
+        evicted = []
+        # The most recently loaded specialist always stays
+        while len(self._loaded) > 1 and self._used_bytes() > self.memory_budget:
+            _, specialist = self._loaded.popitem(last=False)
+            evicted.append(specialist)
+            self._counters["evictions"] += 1
+        return evicted
+
+    def _used_bytes(self):
+        return sum(specialist.size_bytes for specialist in self._loaded.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "available": sorted(self.available),
+                "loaded": list(self._loaded),
+                "loading": sorted(self._loading),
+                "memory_mb": round(self._used_bytes() / (1024 * 1024), 1),
+                "memory_budget_mb": round(self.memory_budget / (1024 * 1024), 1),
+            }
@@ -0,0 +1,112 @@
+import hashlib
+import json
+
+# Detail fields of a disease entry, in response order, with the text used
+# when the knowledge base has no entry for a class
+FIELDS = ("cause", "problem", "solution", "care", "prevention")
+DEFAULTS = {
+    "cause": "No information available.",
+    "problem": "No information available.",
+    "solution": "No solution available.",
+    "care": "No care information available.",
+    "prevention": "No prevention information available.",
+}
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class DiseaseEntry:
+    # Static payload of one class, serialized once. `fragments` maps each field
+    # to its ready-made `"field":"text"` JSON bytes, and `details` is the
+    # comma-joined fragments for every field.
+
+    def __init__(self, class_id, name, info):
+        self.class_id = class_id
+        self.name = name
+        self.name_json = _dumps(name)
+        self.info = {field: info.get(field, DEFAULTS[field]) for field in FIELDS}
+        self.fragments = {field: _dumps(field) + b":" + _dumps(self.info[field]) for field in FIELDS}
+        self.details = b",".join(self.fragments[field] for field in FIELDS)
+
+        # Standalone document for /diseases/<class>
+        self.document = b'{"class":' + self.name_json + b"," + self.details + b"}"
+        self.etag = hashlib.sha256(self.document).hexdigest()[:32]
+
+    def render_fields(self, fields):
+        if fields is None:
+            return self.details
+        return b",".join(self.fragments[field] for field in fields)
+
+
+class DiseaseIndex:
+    # The disease knowledge base, loaded once and indexed by class ID (the
+    # keys of class_indices.json), with a by-name alias for lookups from
+    # prediction results and /diseases/<class>.
+
+    def __init__(self, info_path, class_labels):
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+
+        self.by_id = {}
+        self.by_name = {}
+        for class_id, name in class_labels.items():
+            entry = DiseaseEntry(int(class_id), name, info.get(name, {}))
+            self.by_id[entry.class_id] = entry
+            self.by_name[name] = entry
+
+        # Knowledge base entries that are not model classes can still be
+        # returned (e.g. fallback responses)
+        for name, details in info.items():
+            if name not in self.by_name:
+                self.by_name[name] = DiseaseEntry(None, name, details)
+
+    def get(self, name_or_id):
+        if isinstance(name_or_id, int) or str(name_or_id).isdigit():
+            return self.by_id.get(int(name_or_id))
+        return self.by_name.get(name_or_id)
+
+    def entry_for(self, name):
+        entry = self.by_name.get(name)
+        if entry is None:
+            entry = self.by_name[name] = DiseaseEntry(None, name, {})
+        return entry
+
+    # Serialize a prediction result ({"class", "confidence"} or {"error"}).
+    # Only the class and confidence are encoded per response; the detail
+    # text is spliced in from the pre-serialized entry. `fields` selects a
+    # subset of FIELDS (None for all, () for none) and `prefix` is a dict
+    # of keys to put first, e.g. the file name in batch results.
+    def render(self, result, fields=None, prefix=None):
+        if "class" not in result:
+            return _dumps({**(prefix or {}), **result})
+
+        entry = self.entry_for(result["class"])
+        parts = [b"{"]
+        if prefix:
+            parts.append(_dumps(prefix)[1:-1] + b",")
+        parts.append(b'"class":' + entry.name_json + b',"confidence":' + _dumps(result["confidence"]))
+        for key, value in result.items():
+            if key not in ("class", "confidence") and key not in DEFAULTS:
+                parts.append(b"," + _dumps(key) + b":" + _dumps(value))
+        details = entry.render_fields(fields)
+        if details:
+            parts.append(b"," + details)
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+# Parse ?lite=1 / ?fields=a,b from query arguments into a `fields` value for
+# DiseaseIndex.render; raises ValueError on unknown field names
+def parse_fields(args):
+    if args.get("lite") in ("1", "true", "yes"):
+        return ()
+    requested = args.get("fields")
+    if requested is None:
+        return None
+    fields = tuple(field.strip() for field in requested.split(",") if field.strip())
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}, expected a subset of {list(FIELDS)}")
+    return fields
@@ -0,0 +1,91 @@
+import argparse
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from backends import DEFAULT_MODEL_PATHS
+from preprocess import IMG_SIZE
+from samples import load_samples, sample_dataset
+
+# Define dataset path
+DATASET_PATH = "dataset"
+
+
+def export_tflite(model, output_path, calibration=None):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calibration is not None:
+        def representative_dataset():
+            for sample in calibration:
+                yield [sample[np.newaxis]]
+
+        # Full-integer weights and activations; input/output stay float32 so
+        # the serving code does not need to know the model is quantized
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output_path, calibration=None):
+    import tf2onnx
+
+    input_signature = [tf.TensorSpec((None, IMG_SIZE[1], IMG_SIZE[0], 3), tf.float32, name="input")]
+    float_path = output_path if calibration is None else output_path + ".float"
+    tf2onnx.convert.from_keras(model, input_signature=input_signature, opset=13, output_path=float_path)
+    if calibration is None:
+        return
+
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._samples = iter(calibration)
+
+        def get_next(self):
+            sample = next(self._samples, None)
+            return None if sample is None else {"input": sample[np.newaxis]}
+
+    quantize_static(
+        float_path,
+        output_path,
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QInt8,
+        weight_type=QuantType.QInt8,
+    )
+    os.remove(float_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the trained Keras model for the TFLite/ONNX backends")
+    parser.add_argument("--format", choices=["tflite", "onnx"], default="tflite")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATHS["keras"])
+    parser.add_argument("--output", help="defaults to the backend's artifact path in model/")
+    parser.add_argument("--quantize", choices=["none", "int8"], default="none")
+    parser.add_argument("--dataset", default=DATASET_PATH, help="calibration images for int8")
+    parser.add_argument("--calibration-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    output_path = args.output or DEFAULT_MODEL_PATHS[args.format]
+
+    calibration = None
+    if args.quantize == "int8":
+        calibration = load_samples(sample_dataset(args.dataset, args.calibration_samples))
+        if not len(calibration):
+            parser.error(f"No calibration images found in {args.dataset}")
+        print(f"Calibrating int8 quantization on {len(calibration)} images")
+
+    if args.format == "tflite":
+        export_tflite(model, output_path, calibration)
+    else:
+        export_onnx(model, output_path, calibration)
+
+    print(f"Exported {args.format} model to {output_path} ({os.path.getsize(output_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# gunicorn -c gunicorn.conf.py app:app
+#
+# With PRELOAD_MODEL=1 (tflite backend only) the master imports the app and
+# reads the model artifact once, then forks the workers. Each worker builds
+# its interpreters straight on those bytes without the XNNPACK delegate, so
+# the builtin kernels read the weights in place and every worker shares the
+# master's copy of them copy-on-write. That trades XNNPACK's faster kernels
+# for one copy of the weights per host. Versions hot-swapped in later are
+# loaded by each worker itself. ONNX Runtime copies the weights into every
+# session and keras loads from the file, so neither backend is preloaded.
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+preload_app = os.environ.get("PRELOAD_MODEL") == "1"
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the GC's generations, so cyclic
+    # collections in the workers do not write to (and un-share) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import service
+
+        service.models.start()
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of dead workers from the multiprocess metrics
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
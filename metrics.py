@@ -0,0 +1,184 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+    InfoMetricFamily,
+)
+
+from scoring import UNKNOWN_CLASS
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Per-stage latency of a prediction request:
+#   upload_read  receiving the upload body (spooled to disk past UPLOAD_SPOOL_MEMORY)
+#   cache_lookup hashing the bytes and checking the prediction cache
+#   decode       parsing the image (JPEG draft-mode decode)
+#   resize       resizing and converting to the float32 model input
+#   inference    waiting for the model, batching delay included
+#   serialize    rendering the JSON response
+STAGE_SECONDS = Histogram(
+    "agronex_stage_seconds", "Time spent in each prediction stage", ["stage"], buckets=STAGE_BUCKETS
+)
+REQUESTS = Counter("agronex_requests_total", "HTTP requests by endpoint and status", ["endpoint", "status"])
+IN_FLIGHT = Gauge(
+    "agronex_requests_in_flight", "Requests currently being handled", ["endpoint"],
+    multiprocess_mode="livesum",
+)
+PREDICTIONS = Counter(
+    "agronex_predictions_total",
+    "Predictions served, by class; fallback=\"true\" marks the low-confidence unknown response",
+    ["class_name", "fallback"],
+)
+PREDICTION_ERRORS = Counter("agronex_prediction_errors_total", "Images that could not be predicted")
+# Estimated peak memory of preprocessing one image (a /predict request has
+# one): the part of the upload held in memory, the decoded bitmap and the
+# model input. Capped by UPLOAD_SPOOL_MEMORY, MAX_DECODE_BYTES and IMG_SIZE.
+IMAGE_MEMORY = Histogram(
+    "agronex_image_memory_bytes", "Estimated memory taken to preprocess one image",
+    buckets=tuple(2 ** n for n in range(16, 29, 2)),
+)
+CROP_ROUTES = Counter(
+    "agronex_crop_routes_total",
+    "Images predicted with a crop hint, by route: specialist model or the full model masked to the crop",
+    ["crop", "route"],
+)
+
+
+@contextmanager
+def stage(name):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started_at)
+
+
+def record_result(result):
+    if "error" in result:
+        PREDICTION_ERRORS.inc()
+    else:
+        PREDICTIONS.labels(result["class"], "true" if result["class"] == UNKNOWN_CLASS else "false").inc()
+
+
+class ServiceCollector:
+    # Exports state owned by other objects at scrape time: model/backend
+    # version, batch scheduler histograms, per-version serving stats and
+    # prediction cache counters
+
+    def __init__(self, get_models, get_cache):
+        self.get_models = get_models
+        self.get_cache = get_cache
+
+    def collect(self):
+        models, cache = self.get_models(), self.get_cache()
+        if models is None:
+            return
+        runtime = models.primary
+
+        info = InfoMetricFamily("agronex_model", "Model being served")
+        info.add_metric([], {
+            "backend": runtime.backend_name,
+            "model_path": runtime.model_path,
+            "version": runtime.version or "",
+        })
+        yield info
+
+        swaps = CounterMetricFamily("agronex_model_swaps", "Model versions hot-swapped in")
+        swaps.add_metric([], models.swaps)
+        yield swaps
+
+        ready = GaugeMetricFamily("agronex_model_ready", "1 once the model is loaded and warmed up")
+        ready.add_metric([], 1.0 if runtime.ready.is_set() else 0.0)
+        yield ready
+
+        if runtime.scheduler is not None:
+            scheduler = runtime.scheduler
+            yield _histogram("agronex_batch_size", "Images per forward pass", scheduler.batch_sizes)
+            yield _histogram(
+                "agronex_batch_queue_wait_milliseconds", "Time an image waited for its batch",
+                scheduler.queue_wait_ms,
+            )
+            yield _histogram(
+                "agronex_batch_inference_milliseconds", "Backend predict time per batch",
+                scheduler.inference_ms,
+            )
+
+        latency = HistogramMetricFamily(
+            "agronex_model_version_latency_milliseconds",
+            "Submit-to-scores time per model version and role (primary, candidate, shadow)",
+            labels=["version", "role"],
+        )
+        predictions = CounterMetricFamily(
+            "agronex_model_version_predictions", "Predicted classes per model version and role",
+            labels=["version", "role", "class_name"],
+        )
+        agreement = GaugeMetricFamily(
+            "agronex_model_shadow_agreement", "Share of shadow predictions matching the served class",
+            labels=["version"],
+        )
+        for stats in list(models.stats_by_version.values()):
+            snapshot = stats.snapshot()
+            histogram = snapshot["latency_ms"]
+            latency.add_metric([stats.version, stats.role], list(histogram["buckets"].items()), histogram["sum"])
+            for class_name, count in snapshot["classes"].items():
+                predictions.add_metric([stats.version, stats.role, class_name], count)
+            if "shadow_agreement" in snapshot:
+                agreement.add_metric([stats.version], snapshot["shadow_agreement"])
+        yield latency
+        yield predictions
+        yield agreement
+
+        if cache is not None:
+            stats = cache.stats()
+            for name in (
+                "memory_hits", "disk_hits", "misses", "evictions", "expirations", "invalidations",
+                "disk_expirations", "disk_evictions", "disk_invalidations",
+            ):
+                counter = CounterMetricFamily(f"agronex_cache_{name}", f"Prediction cache {name.replace('_', ' ')}")
+                counter.add_metric([], stats[name])
+                yield counter
+
+
+def _histogram(name, documentation, histogram):
+    snapshot = histogram.snapshot()
+    family = HistogramMetricFamily(name, documentation)
+    family.add_metric([], list(snapshot["buckets"].items()), snapshot["sum"])
+    return family
+
+
+_collector = None
+
+
+def register_service(get_models, get_cache):
+    global _collector
+    if _collector is not None:
+        REGISTRY.unregister(_collector)
+    _collector = ServiceCollector(get_models, get_cache)
+    REGISTRY.register(_collector)
+
+
+# With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR so the metrics
+# of every worker are aggregated (see gunicorn.conf.py). Collector-based
+# metrics then only reflect the worker that answered the scrape.
+def render():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        if _collector is not None:
+            registry.register(_collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,277 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from batching import Histogram
+from cache import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+ROLES = ("primary", "candidate")
+
+
+class VersionStats:
+    # What one model version did while serving (or shadowing): latency from
+    # submit to scores, batching delay included, and the classes it predicted.
+    # For a shadowed candidate, `agreements` counts how often its top class
+    # matched the primary's answer for the same image.
+
+    def __init__(self, version, role, path):
+        self.version = version
+        self.role = role
+        self.path = path
+        self.latency_ms = Histogram(LATENCY_MS_BUCKETS)
+        self.classes = Counter()
+        self.errors = 0
+        self.comparisons = 0
+        self.agreements = 0
+        self._lock = threading.Lock()
+
+    def observe(self, latency_ms, error=False):
+        self.latency_ms.observe(latency_ms)
+        if error:
+            with self._lock:
+                self.errors += 1
+
+    def record_class(self, class_name, agrees=None):
+        with self._lock:
+            self.classes[class_name] += 1
+            if agrees is not None:
+                self.comparisons += 1
+                self.agreements += int(agrees)
+
+    def snapshot(self):
+        with self._lock:
+            classes, errors = dict(self.classes), self.errors
+            comparisons, agreements = self.comparisons, self.agreements
+        snapshot = {
+            "version": self.version,
+            "role": self.role,
+            "path": self.path,
+            "latency_ms": self.latency_ms.snapshot(),
+            "classes": classes,
+            "errors": errors,
+        }
+        if comparisons:
+            snapshot["shadow_comparisons"] = comparisons
+            snapshot["shadow_agreement"] = round(agreements / comparisons, 4)
+        return snapshot
+
+
+class ModelManager:
+    # Serves one or two versions of the model and hot-swaps them.
+    #
+    # A watcher thread fingerprints each role's artifact every
+    # `watch_interval` seconds. Once a changed file has looked the same on two
+    # polls (so it is not still being written), a new ModelRuntime is loaded
+    # and warmed up in the background and then swapped in under the lock.
+    # Requests keep using the old version until then. The old version's batch
+    # scheduler drains whatever was already submitted and stops. A version
+    # that fails to load is logged and skipped until its file changes again.
+    #
+    # With a candidate, `candidate_weight` of the traffic is served by it, and
+    # with `shadow` every primary-served request is also sent to the candidate,
+    # whose answer is only recorded. Each version gets its own VersionStats.
+    # `on_swap`, if given, is called with the old and new runtime after a swap.
+
+    def __init__(self, runtime_factory, primary_path, candidate_path=None, candidate_weight=0.0,
+                 shadow=False, watch_interval=2.0, on_swap=None):
+        self.runtime_factory = runtime_factory
+        self.on_swap = on_swap
+        self.paths = {"primary": primary_path, "candidate": candidate_path}
+        self.candidate_weight = float(candidate_weight)
+        self.shadow = bool(shadow)
+        self.watch_interval = float(watch_interval)
+
+        self.primary = self._create("primary")
+        self.candidate = self._create("candidate") if candidate_path else None
+        self.stats_by_version = {}
+        for runtime in (self.primary, self.candidate):
+            if runtime is not None:
+                self._stats_for(runtime, runtime.role)
+
+        self.swaps = 0
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._failed = {}
+        self._loading = set()
+        self._watcher = None
+        self._random = random.Random()
+
+    def _create(self, role):
+        # Fingerprint before reading, so a write during the load shows up as a change
+        version = file_fingerprint([self.paths[role]])
+        runtime = self.runtime_factory(self.paths[role])
+        runtime.version = version
+        runtime.role = role
+        return runtime
+
+    def _stats_for(self, runtime, role):
+        key = (runtime.version, role)
+        stats = self.stats_by_version.get(key)
+        if stats is None:
+            stats = self.stats_by_version.setdefault(key, VersionStats(runtime.version, role, runtime.model_path))
+        return stats
+
+    @property
+    def ready(self):
+        return self.primary.ready
+
+    @property
+    def error(self):
+        return self.primary.error
+
+    def preload(self):
+        for runtime in (self.primary, self.candidate):
+            if runtime is not None:
+                runtime.preload()
+
+    # Load the initial versions and start watching; in each worker after a fork
+    def start(self):
+        for runtime in (self.primary, self.candidate):
+            if runtime is not None:
+                runtime.start()
+        if self.watch_interval > 0 and (self._watcher is None or not self._watcher.is_alive()):
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    # Pick the runtime that answers a request, and the one shadowing it (or None)
+    def route(self):
+        primary, candidate = self.primary, self.candidate
+        if candidate is None or not candidate.ready.is_set():
+            return primary, None
+        if self.candidate_weight and self._random.random() < self.candidate_weight:
+            return candidate, None
+        return primary, candidate if self.shadow else None
+
+    # Queue an image on `runtime`, or on the current version of its role if
+    # it was swapped out meanwhile; returns (future, runtime)
+    def submit(self, img_array, runtime):
+        with self._lock:
+            if runtime.retired:
+                runtime = self.primary if runtime.role == "primary" else self.candidate
+            future = runtime.scheduler.submit(img_array)
+        self._time(future, self._stats_for(runtime, runtime.role))
+        return future, runtime
+
+    # Same for a shadow copy: never raises, dropped when its queue is full
+    def submit_shadow(self, img_array, runtime):
+        try:
+            with self._lock:
+                if runtime.retired or not runtime.ready.is_set():
+                    return None
+                future = runtime.scheduler.submit(img_array)
+        except Exception:
+            return None
+        self._time(future, self._stats_for(runtime, "shadow"))
+        return future, runtime
+
+    def _time(self, future, stats):
+        submitted_at = time.perf_counter()
+        future.add_done_callback(
+            lambda done: stats.observe((time.perf_counter() - submitted_at) * 1000.0, done.exception() is not None)
+        )
+
+    def record_result(self, runtime, result):
+        if "class" in result:
+            self._stats_for(runtime, runtime.role).record_class(result["class"])
+
+    # Score the shadow's answer once it arrives and compare it with the result served
+    def compare_shadow(self, shadow, served_result, score_fn):
+        future, runtime = shadow
+        stats = self._stats_for(runtime, "shadow")
+
+        def done(future):
+            if future.exception() is not None or "class" not in served_result:
+                return
+            try:
+                result = score_fn(future.result())
+            except Exception:
+                logger.exception("Failed to score a shadow prediction")
+                return
+            stats.record_class(result["class"], result["class"] == served_result["class"])
+
+        future.add_done_callback(done)
+
+    # --- Hot reload -------------------------------------------------------------
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            for role in ROLES:
+                if self.paths[role]:
+                    try:
+                        self._check(role)
+                    except Exception:
+                        logger.exception("Model watcher failed for %s", self.paths[role])
+
+    def _check(self, role):
+        current = self.primary if role == "primary" else self.candidate
+        fingerprint = file_fingerprint([self.paths[role]])
+        if fingerprint == current.version or fingerprint == self._failed.get(role) or role in self._loading:
+            self._seen.pop(role, None)
+            return
+        # Wait for the file to look the same twice, so it is not half-written
+        if self._seen.get(role) != fingerprint:
+            self._seen[role] = fingerprint
+            return
+        self._seen.pop(role, None)
+        self._loading.add(role)
+        threading.Thread(target=self._reload, args=(role,), name=f"model-reload-{role}", daemon=True).start()
+
+    def _reload(self, role):
+        try:
+            runtime = self._create(role)
+            logger.info("Loading %s model version %s from %s", role, runtime.version, runtime.model_path)
+            runtime.load()
+            if not runtime.ready.is_set():
+                logger.error("Not swapping in %s model version %s: %s", role, runtime.version, runtime.error)
+                self._failed[role] = runtime.version
+                return
+
+            with self._lock:
+                old = self.primary if role == "primary" else self.candidate
+                if role == "primary":
+                    self.primary = runtime
+                else:
+                    self.candidate = runtime
+                old.retired = True
+                self._stats_for(runtime, role)
+                self.swaps += 1
+            # No submit can reach the old scheduler any more; let it drain
+            old.close()
+            logger.info("Swapped %s model %s -> %s", role, old.version, runtime.version)
+            if self.on_swap is not None:
+                try:
+                    self.on_swap(old, runtime)
+                except Exception:
+                    logger.exception("Swap callback failed for %s model %s", role, runtime.version)
+        finally:
+            self._loading.discard(role)
+
+    # Versions currently served, primary first
+    def versions(self):
+        return [runtime.version for runtime in (self.primary, self.candidate) if runtime is not None]
+
+    def status(self):
+        status = {
+            **self.primary.status(),
+            "version": self.primary.version,
+            "swaps": self.swaps,
+            "watch_interval": self.watch_interval,
+        }
+        if self.candidate is not None:
+            status["candidate"] = {
+                **self.candidate.status(),
+                "version": self.candidate.version,
+                "weight": self.candidate_weight,
+                "shadow": self.shadow,
+            }
+        return status
+
+    def stats(self):
+        return [stats.snapshot() for stats in list(self.stats_by_version.values())]
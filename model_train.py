@@ -1,7 +1,15 @@
-import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+import argparse
+import glob
+import hashlib
 import json
 import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from crops import SPECIALIST_DIR, crop_key
+from scoring import UNKNOWN_CLASS, apply_temperature, expected_calibration_error, fit_temperature, negative_log_likelihood
 
 # Define dataset path
 DATASET_PATH = "dataset"
@@ -9,68 +17,364 @@ DATASET_PATH = "dataset"
 # Image size and batch size
 IMG_SIZE = (128, 128)
 BATCH_SIZE = 32
+VALIDATION_SPLIT = 0.2
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+MODEL_PATH = "model/plant_disease_model.h5"
+CALIBRATION_PATH = "model/calibration.json"
+
+# Per-crop specialists: half the full model's filters, about a quarter of its compute
+SPECIALIST_FILTERS = (16, 32, 64)
+SPECIALIST_DENSE_UNITS = 64
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+# List (path, label) pairs per subset. Classes are the sorted subdirectories
+# and the first 20% of each class's sorted files are the validation split,
+# exactly as ImageDataGenerator.flow_from_directory(validation_split=0.2)
+# did, so class indices and validation sets match earlier runs.
+def list_dataset(dataset_path, validation_split=VALIDATION_SPLIT):
+    class_names = sorted(
+        name for name in os.listdir(dataset_path) if os.path.isdir(os.path.join(dataset_path, name))
+    )
+    subsets = {"training": [], "validation": []}
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(dataset_path, class_name)
+        files = sorted(
+            os.path.join(class_dir, name)
+            for name in os.listdir(class_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        split = int(validation_split * len(files))
+        subsets["validation"] += [(path, label) for path in files[:split]]
+        subsets["training"] += [(path, label) for path in files[split:]]
+    return class_names, subsets
+
+
+# Decode and resize one file to uint8; flow_from_directory resized with
+# nearest-neighbour interpolation, which stays the default
+def load_image(path, label, resize_method="nearest"):
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(tf.cast(image, tf.float32), IMG_SIZE, method=resize_method)
+    return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8), label
+
+
+def to_model_input(images, labels, num_classes):
+    return tf.cast(images, tf.float32) / 255.0, tf.one_hot(labels, num_classes)
+
+
+def path_dataset(samples):
+    paths = tf.constant([path for path, _ in samples])
+    labels = tf.constant([label for _, label in samples], dtype=tf.int32)
+    return tf.data.Dataset.from_tensor_slices((paths, labels))
+
+
+# --- Preprocessed shard cache -------------------------------------------------
+# Resized uint8 images are written once as TFRecord shards; later runs (and
+# every epoch) read raw pixels back instead of decoding JPEGs again. The cache
+# directory is keyed by the file list and preprocessing settings.
+
+def cache_key(samples, resize_method):
+    digest = hashlib.sha256()
+    digest.update(f"{IMG_SIZE}:{resize_method};".encode())
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}:{label}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def write_shards(samples, shard_dir, resize_method, num_shards):
+    os.makedirs(shard_dir, exist_ok=True)
+    started_at = time.perf_counter()
+    writers = [
+        tf.io.TFRecordWriter(os.path.join(shard_dir, f"shard-{i:05d}-of-{num_shards:05d}.tfrecord"))
+        for i in range(num_shards)
+    ]
+    dataset = path_dataset(samples).map(
+        lambda path, label: load_image(path, label, resize_method), num_parallel_calls=AUTOTUNE
+    ).prefetch(AUTOTUNE)
+    for i, (image, label) in enumerate(dataset.as_numpy_iterator()):
+        example = tf.train.Example(features=tf.train.Features(feature={
+            "image": tf.train.Feature(bytes_list=tf.train.BytesList(value=[image.tobytes()])),
+            "label": tf.train.Feature(int64_list=tf.train.Int64List(value=[label])),
+        }))
+        writers[i % num_shards].write(example.SerializeToString())
+    for writer in writers:
+        writer.close()
+
+    # Written last, so an interrupted run is rebuilt instead of half-used
+    with open(os.path.join(shard_dir, "COMPLETE"), "w") as f:
+        f.write(str(len(samples)))
+    elapsed = time.perf_counter() - started_at
+    print(f"Cached {len(samples)} images to {shard_dir} in {elapsed:.1f}s ({len(samples) / elapsed:.0f} images/sec)")
+
+
+def parse_example(record):
+    features = tf.io.parse_single_example(record, {
+        "image": tf.io.FixedLenFeature([], tf.string),
+        "label": tf.io.FixedLenFeature([], tf.int64),
+    })
+    image = tf.reshape(tf.io.decode_raw(features["image"], tf.uint8), IMG_SIZE + (3,))
+    return image, tf.cast(features["label"], tf.int32)
+
+
+def cached_dataset(samples, cache_dir, subset, resize_method, num_shards):
+    shard_dir = os.path.join(cache_dir, f"{subset}-{cache_key(samples, resize_method)}")
+    if not os.path.exists(os.path.join(shard_dir, "COMPLETE")):
+        write_shards(samples, shard_dir, resize_method, num_shards)
+    shards = sorted(glob.glob(os.path.join(shard_dir, "*.tfrecord")))
+    return tf.data.TFRecordDataset(shards, num_parallel_reads=AUTOTUNE).map(
+        parse_example, num_parallel_calls=AUTOTUNE
+    )
+
+
+# --- Input pipeline -----------------------------------------------------------
+
+def build_dataset(samples, num_classes, training, args, subset):
+    if args.cache_dir:
+        dataset = cached_dataset(samples, args.cache_dir, subset, args.resize_method, args.cache_shards)
+        if training:
+            dataset = dataset.shuffle(args.shuffle_buffer, reshuffle_each_iteration=True)
+    else:
+        dataset = path_dataset(samples)
+        if training:
+            # Shuffling paths is cheap, so shuffle the whole epoch
+            dataset = dataset.shuffle(len(samples), reshuffle_each_iteration=True)
+        dataset = dataset.map(
+            lambda path, label: load_image(path, label, args.resize_method), num_parallel_calls=AUTOTUNE
+        )
+
+    return (
+        dataset.batch(args.batch_size)
+        .map(lambda images, labels: to_model_input(images, labels, num_classes), num_parallel_calls=AUTOTUNE)
+        .prefetch(AUTOTUNE)
+    )
+
+
+# Logs training images/sec per epoch (validation excluded)
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    def __init__(self, num_images):
+        super().__init__()
+        self.num_images = num_images
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.started_at = time.perf_counter()
+        self.train_seconds = None
+
+    def on_test_begin(self, logs=None):
+        if self.train_seconds is None:
+            self.train_seconds = time.perf_counter() - self.started_at
+
+    def on_epoch_end(self, epoch, logs=None):
+        train_seconds = self.train_seconds or time.perf_counter() - self.started_at
+        rate = self.num_images / train_seconds
+        print(f"Epoch {epoch + 1}: {self.num_images} images in {train_seconds:.1f}s ({rate:.0f} images/sec)")
+        if logs is not None:
+            logs["images_per_sec"] = rate
+
+
+# Define CNN Model. Per-crop specialists use the same layers, narrower.
+def build_model(num_classes, filters=(32, 64, 128), dense_units=128):
+    return tf.keras.models.Sequential([
+        tf.keras.layers.Conv2D(filters[0], (3, 3), activation='relu', input_shape=(128, 128, 3)),
+        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(filters[1], (3, 3), activation='relu'),
+        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Conv2D(filters[2], (3, 3), activation='relu'),
+        tf.keras.layers.MaxPooling2D(2, 2),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(dense_units, activation='relu'),
+        tf.keras.layers.Dropout(0.5),
+        # Softmax stays float32 under mixed precision for numeric stability
+        tf.keras.layers.Dense(num_classes, activation='softmax', dtype='float32')
+    ])
+
+
+# Time one pass over the input pipeline alone, to compare loaders
+def benchmark_input(dataset, num_images):
+    started_at = time.perf_counter()
+    for _ in dataset:
+        pass
+    elapsed = time.perf_counter() - started_at
+    print(f"Input pipeline: {num_images} images in {elapsed:.1f}s ({num_images / elapsed:.0f} images/sec)")
+
+
+# Fit the softmax temperature on the validation split (see scoring.py).
+# Labels are read back from the dataset because shard interleaving does not
+# keep file order.
+def calibrate(model, val_data):
+    scores, labels = [], []
+    for images, one_hot in val_data:
+        scores.append(np.asarray(model.predict_on_batch(images), dtype=np.float64))
+        labels.append(np.argmax(one_hot.numpy(), axis=1))
+    scores, labels = np.concatenate(scores), np.concatenate(labels)
+
+    temperature = fit_temperature(scores, labels)
+    calibrated = apply_temperature(scores, temperature)
+    report = {
+        "temperature": temperature,
+        "validation_images": int(len(labels)),
+        "accuracy": float((scores.argmax(axis=1) == labels).mean()),
+        "nll_before": negative_log_likelihood(scores, labels),
+        "nll_after": negative_log_likelihood(calibrated, labels),
+        "ece_before": expected_calibration_error(scores, labels),
+        "ece_after": expected_calibration_error(calibrated, labels),
+    }
+    print(f"Temperature {temperature:.3f}: NLL {report['nll_before']:.4f} -> {report['nll_after']:.4f}, "
+          f"ECE {report['ece_before']:.4f} -> {report['ece_after']:.4f}")
+    return report
+
+
+def save_calibration(model, val_data):
+    with open(CALIBRATION_PATH, "w") as f:
+        json.dump(calibrate(model, val_data), f, indent=2)
+    print(f"Calibration saved to {CALIBRATION_PATH}")
+
+
+def train(num_classes, train_data, val_data, num_images, args, **model_options):
+    if args.mixed_precision:
+        tf.keras.mixed_precision.set_global_policy("mixed_float16")
+
+    model = build_model(num_classes, **model_options)
+
+    # Compile the model
+    model.compile(
+        optimizer="adam",
+        loss="categorical_crossentropy",
+        metrics=["accuracy"]
+    )
+
+    # Train the model
+    model.fit(
+        train_data,
+        validation_data=val_data,
+        epochs=args.epochs,
+        callbacks=[ThroughputLogger(num_images)]
+    )
+
+    # Serving runs on CPU, where float16 layers are slow: return a float32 copy
+    if args.mixed_precision:
+        tf.keras.mixed_precision.set_global_policy("float32")
+        trained = model
+        model = build_model(num_classes, **model_options)
+        model.set_weights(trained.get_weights())
+    return model
+
+
+# Train a small specialist per crop on that crop's classes (plus the unknown
+# class, when the dataset has one) and save it to model/crops/<crop>.h5 with
+# a <crop>.json listing its classes in output order; see crops.py for how the
+# service routes ?crop= requests to them. Crops with a single disease class
+# are skipped: masking the full model already answers those.
+def train_per_crop(args, class_names, subsets):
+    by_crop = {}
+    unknown = [label for label, name in enumerate(class_names) if name.lower() == UNKNOWN_CLASS]
+    for label, name in enumerate(class_names):
+        if name.lower() != UNKNOWN_CLASS:
+            by_crop.setdefault(crop_key(name), []).append(label)
+
+    wanted = [crop_key(crop) for crop in args.crops.split(",")] if args.crops else sorted(by_crop)
+    os.makedirs(SPECIALIST_DIR, exist_ok=True)
+    for crop in wanted:
+        if crop not in by_crop:
+            raise SystemExit(f"Unknown crop {crop!r}, expected one of {sorted(by_crop)}")
+        if len(by_crop[crop]) < 2:
+            print(f"Skipping {crop}: a single class needs no specialist")
+            continue
+
+        # Relabel to the specialist's own 0..n-1 outputs
+        labels = by_crop[crop] + unknown
+        local = {label: index for index, label in enumerate(labels)}
+        crop_subsets = {
+            subset: [(path, local[label]) for path, label in samples if label in local]
+            for subset, samples in subsets.items()
+        }
+        print(f"{crop}: {len(labels)} classes, {len(crop_subsets['training'])} training images")
+
+        train_data = build_dataset(crop_subsets["training"], len(labels), True, args, f"training-{crop}")
+        val_data = build_dataset(crop_subsets["validation"], len(labels), False, args, f"validation-{crop}")
+        model = train(len(labels), train_data, val_data, len(crop_subsets["training"]), args,
+                      filters=SPECIALIST_FILTERS, dense_units=SPECIALIST_DENSE_UNITS)
+        model.save(os.path.join(SPECIALIST_DIR, f"{crop}.h5"))
+
+        config = {"crop": crop, "classes": [class_names[label] for label in labels]}
+        if args.calibrate:
+            config["temperature"] = calibrate(model, val_data)["temperature"]
+        with open(os.path.join(SPECIALIST_DIR, f"{crop}.json"), "w") as f:
+            json.dump(config, f, indent=2)
+        print(f"Saved the {crop} specialist to {SPECIALIST_DIR}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the plant disease classifier")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--epochs", type=int, default=6)  # Change based on your requirements
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--resize-method", default="nearest",
+                        help="tf.image.resize method; nearest matches the old ImageDataGenerator loader")
+    parser.add_argument("--cache-dir", help="write/read preprocessed uint8 TFRecord shards here")
+    parser.add_argument("--cache-shards", type=int, default=16)
+    parser.add_argument("--shuffle-buffer", type=int, default=10000)
+    parser.add_argument("--mixed-precision", action="store_true", help="train with the mixed_float16 policy")
+    parser.add_argument("--benchmark-input", action="store_true",
+                        help="only time one pass over the training input pipeline")
+    parser.add_argument("--calibrate", action="store_true",
+                        help=f"after training, fit temperature scaling on the validation split ({CALIBRATION_PATH})")
+    parser.add_argument("--calibrate-only", action="store_true",
+                        help=f"fit temperature scaling for the saved {MODEL_PATH} without training")
+    parser.add_argument("--per-crop", action="store_true",
+                        help=f"train small per-crop specialists into {SPECIALIST_DIR} instead of the full model")
+    parser.add_argument("--crops", help="comma separated crops for --per-crop, default all")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    class_names, subsets = list_dataset(args.dataset)
+    num_classes = len(class_names)
+    print(f"Found {len(subsets['training'])} training and {len(subsets['validation'])} "
+          f"validation images in {num_classes} classes")
+
+    # Specialists map back to the full model's classes by name
+    if args.per_crop:
+        train_per_crop(args, class_names, subsets)
+        return
+
+    train_data = build_dataset(subsets["training"], num_classes, True, args, "training")
+    val_data = build_dataset(subsets["validation"], num_classes, False, args, "validation")
+
+    if args.benchmark_input:
+        benchmark_input(train_data, len(subsets["training"]))
+        return
+
+    if args.calibrate_only:
+        # The saved model's labels must be this dataset's, or calibration
+        # would score it against remapped classes
+        with open("model/class_indices.json", "r") as f:
+            saved_names = [name for _, name in sorted(json.load(f).items(), key=lambda item: int(item[0]))]
+        if saved_names != class_names:
+            raise SystemExit(f"{args.dataset} does not have the classes of model/class_indices.json")
+        save_calibration(tf.keras.models.load_model(MODEL_PATH), val_data)
+        return
+
+    # Save class indices as JSON. Only here, on the training path: the
+    # served labels (and the prediction cache version) follow this file.
+    class_labels = {index: name for index, name in enumerate(class_names)}
+    os.makedirs("model", exist_ok=True)
+    with open("model/class_indices.json", "w") as f:
+        json.dump(class_labels, f)
+
+    model = train(num_classes, train_data, val_data, len(subsets["training"]), args)
+
+    # Save trained model
+    model.save(MODEL_PATH)
+
+    print("Model training complete and saved!")
+
+    if args.calibrate:
+        save_calibration(model, val_data)
+
 
-# Data Augmentation and Preprocessing
-datagen = ImageDataGenerator(
-    rescale=1.0 / 255.0,
-    validation_split=0.2  
-)
-
-# Load dataset
-train_data = datagen.flow_from_directory(
-    DATASET_PATH,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-    subset="training"
-)
-
-val_data = datagen.flow_from_directory(
-    DATASET_PATH,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-    subset="validation"
-)
-
-# Get class indices and save them
-class_indices = train_data.class_indices
-class_labels = {v: k for k, v in class_indices.items()}
-
-# Save class indices as JSON
-os.makedirs("model", exist_ok=True)
-with open("model/class_indices.json", "w") as f:
-    json.dump(class_labels, f)
-
-# Define CNN Model
-model = tf.keras.models.Sequential([
-    tf.keras.layers.Conv2D(32, (3, 3), activation='relu', input_shape=(128, 128, 3)),
-    tf.keras.layers.MaxPooling2D(2, 2),
-    tf.keras.layers.Conv2D(64, (3, 3), activation='relu'),
-    tf.keras.layers.MaxPooling2D(2, 2),
-    tf.keras.layers.Conv2D(128, (3, 3), activation='relu'),
-    tf.keras.layers.MaxPooling2D(2, 2),
-    tf.keras.layers.Flatten(),
-    tf.keras.layers.Dense(128, activation='relu'),
-    tf.keras.layers.Dropout(0.5),
-    tf.keras.layers.Dense(len(class_labels), activation='softmax')  
-])
-
-# Compile the model
-model.compile(
-    optimizer="adam",
-    loss="categorical_crossentropy",
-    metrics=["accuracy"]
-)
-
-# Train the model
-model.fit(
-    train_data,
-    validation_data=val_data,
-    epochs=6 # Change based on your requirements
-)
-
-# Save trained model
-model.save("model/plant_disease_model.h5")
-
-print("Model training complete and saved!")
+if __name__ == "__main__":
+    main()
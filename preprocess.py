@@ -0,0 +1,111 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (128, 128)
+
+# Inputs above these limits are rejected before any pixel data is decoded
+MAX_IMAGE_BYTES = int(os.environ.get("MAX_IMAGE_BYTES", str(32 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+# Largest decoded bitmap allowed, after JPEG draft-mode scaling; caps the
+# memory one image can take while it is being preprocessed
+MAX_DECODE_BYTES = int(os.environ.get("MAX_DECODE_BYTES", str(128 * 1024 * 1024)))
+
+# Let Pillow shrink by whole factors (box filter) until the image is within
+# this multiple of the target size, then finish with the regular resampling
+REDUCING_GAP = 3.0
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+# Open an image and validate its header; no pixel data is decoded yet
+def open_image(source, max_pixels=MAX_IMAGE_PIXELS):
+    img = Image.open(source)
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(
+            f"Image is {width}x{height} ({width * height} pixels), limit is {max_pixels}"
+        )
+    return img
+
+
+# Bytes of an image's bitmap, counting the RGB copy made of other modes;
+# known from the header, before any pixel data is decoded
+def decoded_bytes(img):
+    width, height = img.size
+    bands = len(img.getbands())
+    if img.mode not in ("RGB", "L"):
+        bands += 3
+    return width * height * bands
+
+
+# Decode an image, letting libjpeg scale JPEGs down towards `size` while
+# decoding (draft mode) so full-resolution pixels are never materialised
+def decode_image(source, size=IMG_SIZE, max_pixels=MAX_IMAGE_PIXELS, max_bytes=MAX_DECODE_BYTES):
+    img = open_image(source, max_pixels)
+    if img.format == "JPEG":
+        img.draft("RGB", size)
+    if decoded_bytes(img) > max_bytes:
+        raise ImageTooLarge(
+            f"Decoding the {img.size[0]}x{img.size[1]} image takes {decoded_bytes(img)} bytes, "
+            f"limit is {max_bytes}"
+        )
+    img.load()
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    return img
+
+
+# Resize a decoded image to exactly `size` RGB. Large images are box-reduced
+# by whole factors before the final resample.
+def resize_image(img, size=IMG_SIZE):
+    img = img.resize(size, reducing_gap=REDUCING_GAP)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+# Scale a decoded image into a float32 (H, W, 3) array in [0, 1], writing
+# into `out` when a preallocated buffer is given
+def to_array(img, out=None):
+    pixels = np.asarray(img, dtype=np.uint8)
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    np.divide(pixels, np.float32(255.0), out=out)
+    return out
+
+
+# Size of an upload given as bytes or as a seekable binary file
+def upload_size(upload):
+    if isinstance(upload, (bytes, bytearray, memoryview)):
+        return len(upload)
+    size = upload.seek(0, os.SEEK_END)
+    upload.seek(0)
+    return size
+
+
+# Returns the upload's size
+def check_size(upload):
+    size = upload_size(upload)
+    if size > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"Image is {size} bytes, limit is {MAX_IMAGE_BYTES}")
+    return size
+
+
+# Something Image.open can read: files (spooled uploads) are decoded in
+# place, rewound, rather than read into a bytes copy first
+def image_source(upload):
+    if isinstance(upload, (bytes, bytearray, memoryview)):
+        return io.BytesIO(upload)
+    upload.seek(0)
+    return upload
+
+
+def preprocess_image(upload, out=None, size=IMG_SIZE):
+    check_size(upload)
+    return to_array(resize_image(decode_image(image_source(upload), size), size), out)
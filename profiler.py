@@ -0,0 +1,106 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class _Session:
+    __slots__ = ("label", "started_at", "stacks")
+
+    def __init__(self, label):
+        self.label = label
+        self.started_at = time.perf_counter()
+        self.stacks = Counter()
+
+
+class SlowRequestProfiler:
+    # Opt-in sampling profiler. While at least one tracked request is in
+    # flight, a background thread samples the stacks of every thread (request
+    # handlers, decode pool, batch scheduler) every `interval_ms`. Requests
+    # that finish under `threshold_ms` are discarded; slower ones are written
+    # to `output_dir` in collapsed-stack format, one "frame;frame;frame count"
+    # line per stack, ready for flamegraph.pl or speedscope.
+
+    def __init__(self, output_dir, threshold_ms, interval_ms=5.0):
+        self.output_dir = output_dir
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval_ms / 1000.0
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._sampler = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    @contextmanager
+    def track(self, label):
+        session = _Session(label)
+        with self._lock:
+            self._ensure_sampler()
+            self._sessions.add(session)
+            self._active.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sessions.discard(session)
+                if not self._sessions:
+                    self._active.clear()
+            elapsed = time.perf_counter() - session.started_at
+            if elapsed >= self.threshold and session.stacks:
+                self._dump(session, elapsed)
+
+    def _ensure_sampler(self):
+        # Started lazily (and again after a fork) from the first tracked request
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._sampler.start()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stacks.append(_collapse(names.get(ident, str(ident)), frame))
+
+            with self._lock:
+                for session in self._sessions:
+                    session.stacks.update(stacks)
+
+    def _dump(self, session, elapsed):
+        label = "".join(c if c.isalnum() else "_" for c in session.label).strip("_")
+        path = os.path.join(
+            self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{label}-{int(elapsed * 1000)}ms.folded"
+        )
+        with open(path, "w") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _collapse(thread_name, frame):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+# Configured from PROFILE_SLOW_MS (enables it), PROFILE_DIR and PROFILE_INTERVAL_MS
+def profiler_from_env():
+    threshold = os.environ.get("PROFILE_SLOW_MS")
+    if not threshold:
+        return None
+    return SlowRequestProfiler(
+        os.environ.get("PROFILE_DIR", "profiles"),
+        float(threshold),
+        float(os.environ.get("PROFILE_INTERVAL_MS", "5")),
+    )
@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from backends import DEFAULT_MODEL_PATHS, PRELOADABLE_BACKENDS, batch_buckets, load_backend
+from batching import BatchScheduler
+from preprocess import IMG_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRuntime:
+    # Owns the loaded backend and its batch scheduler for one worker process.
+    # Nothing heavy happens on construction: `start` loads and warms the model,
+    # in a background thread by default, and `ready` is set once it can serve.
+    #
+    # For preload-and-fork serving, `preload` reads the model artifact in the
+    # parent process. Forked workers build their interpreters on those bytes,
+    # which the backend then uses in place, so the weights stay shared
+    # copy-on-write (see gunicorn.conf.py). Framework runtimes are never
+    # initialised before the fork because TensorFlow and ONNX Runtime thread
+    # pools do not survive it.
+
+    def __init__(self, backend_name="keras", model_path=None, num_threads=None,
+                 batch_max_size=16, batch_max_wait_ms=5.0, batch_max_queue=0,
+                 warmup_batch_sizes=(1,)):
+        self.backend_name = backend_name
+        self.model_path = model_path or DEFAULT_MODEL_PATHS[backend_name]
+        self.num_threads = num_threads
+        self.batch_max_size = batch_max_size
+        self.batch_max_wait_ms = batch_max_wait_ms
+        self.batch_max_queue = batch_max_queue
+        self.warmup_batch_sizes = tuple(warmup_batch_sizes)
+
+        self.model = None
+        self.scheduler = None
+        # Set by ModelManager: artifact fingerprint, primary/candidate, swapped out
+        self.version = None
+        self.role = "primary"
+        self.retired = False
+        self.model_content = None
+        self.ready = threading.Event()
+        self.error = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def preload(self):
+        if self.backend_name not in PRELOADABLE_BACKENDS:
+            logger.warning(
+                "The %s backend cannot share preloaded weights; each worker loads its own copy",
+                self.backend_name,
+            )
+            return
+        with open(self.model_path, "rb") as f:
+            self.model_content = f.read()
+        logger.info("Preloaded %s (%.1f MB)", self.model_path, len(self.model_content) / 1e6)
+
+    def start(self, background=True):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if background:
+            threading.Thread(target=self.load, name="model-loader", daemon=True).start()
+        else:
+            self.load()
+
+    def load(self):
+        try:
+            started_at = time.perf_counter()
+            model = load_backend(
+                self.backend_name, self.model_path, self.num_threads, content=self.model_content,
+                batch_sizes=batch_buckets(self.batch_max_size) + self.warmup_batch_sizes,
+            )
+            self.load_seconds = time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            self.warmup(model)
+            self.warmup_seconds = time.perf_counter() - started_at
+
+            self.model = model
+            self.scheduler = BatchScheduler(
+                model.predict,
+                max_batch_size=self.batch_max_size,
+                max_wait_ms=self.batch_max_wait_ms,
+                max_queue_size=self.batch_max_queue,
+            )
+            self.ready.set()
+            logger.info(
+                "Model %s ready (load %.2fs, warmup %.2fs)",
+                self.model_path, self.load_seconds, self.warmup_seconds,
+            )
+        except Exception as e:
+            self.error = str(e)
+            logger.exception("Failed to load model %s", self.model_path)
+
+    # Run dummy batches of the common sizes so graph tracing, tensor
+    # allocation and kernel selection happen before the first real request
+    def warmup(self, model):
+        for batch_size in self.warmup_batch_sizes:
+            model.predict(np.zeros((batch_size, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32))
+
+    # Stop the batch scheduler once it has drained; the model itself is freed
+    # when the last request holding it finishes
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.close()
+
+    def status(self):
+        return {
+            "ready": self.ready.is_set(),
+            "error": self.error,
+            "backend": self.backend_name,
+            "model_path": self.model_path,
+            "preloaded": self.model_content is not None,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_batch_sizes": list(self.warmup_batch_sizes),
+        }
@@ -0,0 +1,44 @@
+import os
+import random
+
+import numpy as np
+
+from preprocess import IMG_SIZE, preprocess_image
+
+# Kept free of TensorFlow so benchmarks can load samples on nodes that only
+# have tflite_runtime or onnxruntime installed
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# Pick a class-balanced random sample of (path, class_name) from the dataset
+def sample_dataset(dataset_path, num_samples, seed=0):
+    rng = random.Random(seed)
+    per_class = {}
+    for class_name in sorted(os.listdir(dataset_path)):
+        class_dir = os.path.join(dataset_path, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        files = sorted(
+            os.path.join(class_dir, name)
+            for name in os.listdir(class_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        rng.shuffle(files)
+        per_class[class_name] = files
+
+    # Round-robin over classes so every class is represented
+    samples = []
+    while len(samples) < num_samples and any(per_class.values()):
+        for class_name, files in per_class.items():
+            if files and len(samples) < num_samples:
+                samples.append((files.pop(), class_name))
+    return samples
+
+
+# Preprocess images exactly as the service does
+def load_samples(samples):
+    arrays = []
+    for path, _ in samples:
+        with open(path, "rb") as f:
+            arrays.append(preprocess_image(f.read()))
+    return np.stack(arrays) if arrays else np.empty((0, IMG_SIZE[1], IMG_SIZE[0], 3), np.float32)
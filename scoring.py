@@ -0,0 +1,190 @@
+import json
+import os
+
+import numpy as np
+
+# Class returned when the model is not confident enough; its details are the
+# "unknown" entry of data/disease_info.json
+UNKNOWN_CLASS = "unknown"
+DEFAULT_THRESHOLD = 70.0
+
+# Most alternatives a response can ask for with ?top_k=; results carry this
+# many so cached entries can answer any smaller request
+TOP_K_MAX = int(os.environ.get("TOP_K_MAX", "5"))
+
+
+# Per-class confidence thresholds (percent), as an array indexed by class ID.
+# The file is optional and looks like
+#   {"default": 70, "classes": {"Tomato___healthy": 60, "12": 85}}
+# with classes given by name or ID.
+def load_thresholds(path, class_labels):
+    thresholds = np.full(len(class_labels), DEFAULT_THRESHOLD, dtype=np.float64)
+    if not os.path.exists(path):
+        return thresholds
+
+    with open(path, "r") as f:
+        config = json.load(f)
+    thresholds[:] = float(config.get("default", DEFAULT_THRESHOLD))
+    ids = {name: int(class_id) for class_id, name in class_labels.items()}
+    for name, threshold in config.get("classes", {}).items():
+        class_id = int(name) if name.isdigit() else ids.get(name)
+        if class_id is None or not 0 <= class_id < len(thresholds):
+            raise ValueError(f"{path}: unknown class {name!r}")
+        thresholds[class_id] = float(threshold)
+    return thresholds
+
+
+# Softmax temperature written by `model_train.py --calibrate`; 1.0 (no
+# calibration) when the file does not exist
+def load_temperature(path):
+    if not os.path.exists(path):
+        return 1.0
+    with open(path, "r") as f:
+        return float(json.load(f)["temperature"])
+
+
+# Rescale softmax scores by a temperature. The model outputs probabilities,
+# so this works on their logs, which equal the logits up to a per-row shift.
+def apply_temperature(scores, temperature):
+    if temperature == 1.0:
+        return scores
+    logits = np.log(np.clip(scores, 1e-12, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=1, keepdims=True)
+
+
+# The k best (class IDs, scores) of every row, best first. argpartition
+# finds them without sorting whole rows; only the k winners are sorted.
+def top_k(scores, k):
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(k), scores.shape).copy()
+    top = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top, axis=1, kind="stable")
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+class Scorer:
+    # Turns a batch of softmax rows into prediction results in one vectorized
+    # pass: calibration, an optional mask (e.g. the classes of one crop) with
+    # renormalisation, top-k, then the per-class threshold of the best class.
+    # A masked row whose unmasked probability on the allowed classes is below
+    # `min_mass` falls back too.
+    # Results look like
+    #   {"class", "confidence", "top_k": [{"class", "confidence"}, ...]}
+    # where "class" is UNKNOWN_CLASS below the threshold and "top_k" still
+    # lists the model's best guesses.
+
+    def __init__(self, class_labels, thresholds=None, temperature=1.0, k=TOP_K_MAX):
+        self.labels = [class_labels[str(i)] for i in range(len(class_labels))]
+        self.thresholds = (
+            np.full(len(self.labels), DEFAULT_THRESHOLD) if thresholds is None else np.asarray(thresholds)
+        )
+        self.temperature = temperature
+        self.k = max(1, k)
+        # A model trained with its own unknown class always falls back
+        self._always_unknown = np.array([label.lower() == UNKNOWN_CLASS for label in self.labels])
+
+    def results(self, scores, mask=None, min_mass=0.0, temperature=None):
+        scores = apply_temperature(
+            np.asarray(scores, dtype=np.float64).reshape(-1, len(self.labels)),
+            self.temperature if temperature is None else temperature,
+        )
+        if mask is not None:
+            scores = scores * mask
+            mass = scores.sum(axis=1, keepdims=True)
+            # No probability left on the allowed classes: spread it evenly
+            scores = np.where(mass > 0, scores / np.where(mass > 0, mass, 1.0), mask / mask.sum())
+            # Rank other classes last, so they only pad rows short of k
+            scores = np.where(mask > 0, scores, -1.0)
+        indices, top = top_k(scores, self.k)
+        confidences = np.round(100 * top, 2)
+        best = indices[:, 0]
+        fallback = (confidences[:, 0] < self.thresholds[best]) | self._always_unknown[best]
+        if mask is not None:
+            fallback |= mass[:, 0] < min_mass
+
+        allowed = None if mask is None else mask > 0
+        results = []
+        for row_indices, row_confidences, is_fallback in zip(indices.tolist(), confidences.tolist(),
+                                                             fallback.tolist()):
+            alternatives = [
+                {"class": self.labels[i], "confidence": c}
+                for i, c in zip(row_indices, row_confidences)
+                if allowed is None or allowed[i]
+            ]
+            results.append({
+                "class": UNKNOWN_CLASS if is_fallback else alternatives[0]["class"],
+                "confidence": row_confidences[0],
+                "top_k": alternatives,
+            })
+        return results
+
+
+# The alternatives a response asked for: `k` of the stored top_k, or none
+def select_top_k(result, k):
+    if "top_k" not in result:
+        return result
+    trimmed = {key: value for key, value in result.items() if key != "top_k"}
+    if k:
+        trimmed["top_k"] = result["top_k"][:k]
+    return trimmed
+
+
+# Parse ?top_k= from query arguments; 0 when absent. Raises ValueError.
+def parse_top_k(args):
+    value = args.get("top_k")
+    if value is None or value == "":
+        return 0
+    if not value.isdigit() or not 0 <= int(value) <= TOP_K_MAX:
+        raise ValueError(f"top_k must be an integer from 0 to {TOP_K_MAX}")
+    return int(value)
+
+
+# --- Offline calibration --------------------------------------------------------
+
+def negative_log_likelihood(scores, labels):
+    picked = scores[np.arange(len(labels)), labels]
+    return float(-np.log(np.clip(picked, 1e-12, 1.0)).mean())
+
+
+# Expected calibration error over equal-width confidence bins
+def expected_calibration_error(scores, labels, bins=15):
+    confidence = scores.max(axis=1)
+    correct = scores.argmax(axis=1) == labels
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    bin_ids = np.clip(np.digitize(confidence, edges[1:-1]), 0, bins - 1)
+    error = 0.0
+    for b in range(bins):
+        mask = bin_ids == b
+        if mask.any():
+            error += mask.mean() * abs(correct[mask].mean() - confidence[mask].mean())
+    return float(error)
+
+
+# Temperature minimizing the validation NLL, by golden-section search over
+# log(T) (the NLL is unimodal in it)
+def fit_temperature(scores, labels, low=0.05, high=20.0, iterations=60):
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels)
+
+    def loss(log_t):
+        return negative_log_likelihood(apply_temperature(scores, float(np.exp(log_t))), labels)
+
+    ratio = (np.sqrt(5) - 1) / 2
+    a, b = np.log(low), np.log(high)
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    loss_c, loss_d = loss(c), loss(d)
+    for _ in range(iterations):
+        if loss_c < loss_d:
+            b, d, loss_d = d, c, loss_c
+            c = b - ratio * (b - a)
+            loss_c = loss(c)
+        else:
+            a, c, loss_c = c, d, loss_d
+            d = a + ratio * (b - a)
+            loss_d = loss(d)
+    return float(np.exp((a + b) / 2))
@@ -0,0 +1,386 @@
+import functools
+import json
+import os
+import itertools
+import queue
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import metrics
+from cache import PredictionCache
+from crops import FULL_ROUTE, SPECIALIST_DIR, CropIndex, SpecialistRegistry
+from diseases import DiseaseIndex
+from preprocess import (
+    IMG_SIZE, MAX_IMAGE_BYTES, ImageTooLarge, check_size, decode_image, decoded_bytes, image_source,
+    resize_image, to_array,
+)
+from backends import DEFAULT_MODEL_PATHS, batch_buckets
+from model_manager import ModelManager
+from runtime import ModelRuntime
+from scoring import Scorer, load_temperature, load_thresholds, select_top_k
+from uploads import UploadStore, in_memory_bytes
+
+# Multi-image uploads are decoded in parallel and predicted in chunks
+# through the batch schedulers, like single images
+PREDICT_CHUNK_SIZE = int(os.environ.get("PREDICT_CHUNK_SIZE", "32"))
+SUBMIT_RETRY_SECONDS = 0.005
+DECODE_WORKERS = int(os.environ.get("DECODE_WORKERS", str(os.cpu_count() or 4)))
+decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+
+# Load Class Labels
+CLASS_INDICES_PATH = "model/class_indices.json"
+with open(CLASS_INDICES_PATH, "r") as f:
+    CLASS_LABELS = json.load(f)
+
+# Disease knowledge base, serialized once per class
+DISEASE_INFO_PATH = "data/disease_info.json"
+diseases = DiseaseIndex(DISEASE_INFO_PATH, CLASS_LABELS)
+
+# Optional per-class confidence thresholds and temperature calibration
+# (see scoring.py); both files are part of the prediction cache version
+THRESHOLDS_PATH = "model/thresholds.json"
+CALIBRATION_PATH = "model/calibration.json"
+scorer = Scorer(
+    CLASS_LABELS, load_thresholds(THRESHOLDS_PATH, CLASS_LABELS), load_temperature(CALIBRATION_PATH)
+)
+
+# Classes of each crop, for the ?crop= hint
+crop_index = CropIndex(CLASS_LABELS)
+
+# Resumable uploads, spooled to UPLOAD_DIR (see uploads.py)
+upload_store = UploadStore()
+
+# Set up by setup()
+models = None
+cache = None
+specialists = None
+
+
+# Raised when the batch queue is full; servers answer 429
+class Overloaded(Exception):
+    pass
+
+# Turn one row of softmax scores into a prediction result: the calibrated
+# class and confidence, "unknown" below the class threshold, plus the top
+# alternatives. `route` says how the scores were produced (see crops.Route).
+# diseases.render adds the static detail text.
+def build_result(confidence_scores, route=FULL_ROUTE):
+    return scorer.results(confidence_scores, route.mask, route.min_mass, route.temperature)[0]
+
+# The steps of predict_disease, exposed separately so async servers can run
+# each one on the right executor. Uploads are bytes or seekable binary files
+# (spooled request bodies), which are hashed and decoded in place.
+
+# Cache key of a result for an image: results of each model version, crop
+# hint and route (specialist or masked full model) are cached apart
+def result_key(image_key, runtime, route):
+    key = f"{image_key}:{runtime.version}"
+    if route.crop is not None:
+        key = f"{key}:{route.crop}:{route.kind}"
+    return key
+
+# Cache a result with the model version that produced it. Results of a
+# version swapped out meanwhile are not stored: nothing looks them up again.
+def store_result(image_key, runtime, route, result):
+    if not runtime.retired:
+        cache.put(result_key(image_key, runtime, route), result, runtime.version)
+
+# Returns (image_key, cached_result or None), looking up the result of the
+# route the image would take now. finish() stores the result under the
+# route that actually answered.
+def lookup(upload, crop=None, runtime=None):
+    runtime = runtime or models.primary
+    with metrics.stage("cache_lookup"):
+        image_key = cache.key(upload)
+        if crop is None:
+            route = FULL_ROUTE
+        else:
+            specialist = specialists.get(crop)
+            route = specialist.route if specialist is not None else specialists.masked_route(crop)
+        return image_key, cache.get(result_key(image_key, runtime, route))
+
+# preprocess.preprocess_image, timing decode and resize separately and
+# recording the memory the image took
+def preprocess(upload, out=None):
+    size = check_size(upload)
+    with metrics.stage("decode"):
+        img = decode_image(image_source(upload))
+    with metrics.stage("resize"):
+        img_array = to_array(resize_image(img), out)
+    metrics.IMAGE_MEMORY.observe(in_memory_bytes(upload, size) + decoded_bytes(img) + img_array.nbytes)
+    return img_array
+
+# Queue one preprocessed image for the next batch of `runtime` (the primary
+# model by default), or of the crop's specialist once it is loaded.
+# Returns (Future, route, runtime); the runtime differs from the one passed
+# in if that version was swapped out meanwhile.
+def submit(img_array, crop=None, runtime=None):
+    runtime = runtime or models.primary
+    try:
+        submitted = specialists.submit(crop, img_array) if crop is not None else None
+        if submitted is not None:
+            future, route = submitted
+        else:
+            future, runtime = models.submit(img_array, runtime)
+            route = FULL_ROUTE if crop is None else specialists.masked_route(crop)
+    except queue.Full:
+        raise Overloaded("Too many requests waiting for the model")
+    if crop is not None:
+        metrics.CROP_ROUTES.labels(crop, route.kind).inc()
+    return future, route, runtime
+
+# Raise Overloaded when the primary model's batch queue is full; checked
+# before a multi-image request starts streaming, so it can still get 429
+def check_capacity():
+    scheduler = models.primary.scheduler
+    if scheduler is not None and scheduler.full():
+        raise Overloaded("Too many requests waiting for the model")
+
+# submit() for an image of a multi-image request, waiting for queue space
+# rather than failing: once the response streams it can no longer be 429
+def _submit_waiting(img_array, crop, runtime):
+    while True:
+        try:
+            return submit(img_array, crop, runtime)
+        except Overloaded:
+            time.sleep(SUBMIT_RETRY_SECONDS)
+
+# Send a copy to the shadowing model version, if any; returns a handle for
+# finish() or None. Crop-hinted requests are not shadowed.
+def submit_shadow(img_array, crop, shadow_runtime):
+    if shadow_runtime is None or crop is not None:
+        return None
+    return models.submit_shadow(img_array, shadow_runtime)
+
+def finish(image_key, confidence_scores, route=FULL_ROUTE, runtime=None, shadow=None):
+    runtime = runtime or models.primary
+    result = build_result(np.asarray(confidence_scores), route)
+    store_result(image_key, runtime, route, result)
+    metrics.record_result(result)
+    if route.kind != "specialist":
+        models.record_result(runtime, result)
+    if shadow is not None:
+        models.compare_shadow(shadow, result, build_result)
+    return result
+
+# Function to Predict Disease; `top_k` alternatives are included when asked
+# for and `crop` restricts the prediction to one crop's classes
+def predict_disease(upload, top_k=0, crop=None):
+    try:
+        serving, shadowing = models.route()
+        image_key, cached = lookup(upload, crop, serving)
+        if cached is not None:
+            metrics.record_result(cached)
+            return select_top_k(cached, top_k)
+
+        img_array = preprocess(upload)
+
+        # Make predictions (batched together with concurrent requests)
+        with metrics.stage("inference"):
+            future, route, serving = submit(img_array, crop, serving)
+            shadow = submit_shadow(img_array, crop, shadowing)
+            confidence_scores = future.result()
+        return select_top_k(finish(image_key, confidence_scores, route, serving, shadow), top_k)
+    except Overloaded:
+        raise
+    except Exception as e:
+        result = {"error": str(e)}
+        metrics.record_result(result)
+        return result
+
+# Yield (name, load) for every uploaded image, expanding zip archives
+# lazily; load() returns the upload. Spool files are decoded in place, and
+# archive members are only read by the decode thread that needs them, so a
+# chunk never holds more of them in memory than there are decode workers.
+def iter_uploads(files):
+    for filename, stream in files:
+        if zipfile.is_zipfile(stream):
+            stream.seek(0)
+            # Left open: members are read after the generator moves on. The
+            # archive does not own the spool file, which the caller closes.
+            try:
+                archive = zipfile.ZipFile(stream)
+            except (zipfile.BadZipFile, OSError) as e:
+                # The end record was intact but the rest is not: one error line
+                yield filename, functools.partial(_unreadable_archive, e)
+                continue
+            for member in archive.infolist():
+                if not member.is_dir():
+                    yield member.filename, functools.partial(_read_member, archive, member)
+        else:
+            yield filename, functools.partial(image_source, stream)
+
+def _unreadable_archive(error):
+    raise ValueError(f"Unreadable zip archive: {error}")
+
+def _read_member(archive, member):
+    # Checked before decompressing anything
+    if member.file_size > MAX_IMAGE_BYTES:
+        raise ImageTooLarge(f"Image is {member.file_size} bytes, limit is {MAX_IMAGE_BYTES}")
+    return archive.read(member)
+
+# Decodes into `out`; returns (name, image_key, decoded, cached_result, error)
+def _decode(name, load, out, crop, runtime):
+    try:
+        upload = load()
+        image_key, cached = lookup(upload, crop, runtime)
+        if cached is not None:
+            return name, image_key, False, cached, None
+        preprocess(upload, out=out)
+        return name, image_key, True, None, None
+    except Exception as e:
+        return name, None, False, None, str(e)
+
+# Decode a chunk into one preallocated float32 batch buffer. The whole chunk
+# is answered by one model version, picked here.
+def _decode_chunk(chunk, crop):
+    runtime, _ = models.route()
+    buffer = np.empty((len(chunk), IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+    futures = [
+        decode_pool.submit(_decode, name, load, buffer[i], crop, runtime)
+        for i, (name, load) in enumerate(chunk)
+    ]
+    return buffer, futures, runtime
+
+# Yields (name, result) for every upload, in order
+def predict_many(uploads, top_k=0, crop=None):
+    for name, result in _predict_chunks(uploads, crop):
+        metrics.record_result(result)
+        yield name, select_top_k(result, top_k)
+
+# Decode chunk N+1 while chunk N runs through the model, so at most two
+# chunks of decoded arrays are alive at a time
+def _predict_chunks(uploads, crop):
+    buffer, pending, runtime = _decode_chunk(list(itertools.islice(uploads, PREDICT_CHUNK_SIZE)), crop)
+    while pending:
+        next_buffer, next_pending, next_runtime = _decode_chunk(
+            list(itertools.islice(uploads, PREDICT_CHUNK_SIZE)), crop
+        )
+
+        decoded = [future.result() for future in pending]
+        # Rows are batched with concurrent requests by the scheduler of the
+        # route they get: the crop's specialist or the (masked) full model
+        submitted = {i: _submit_waiting(buffer[i], crop, runtime) for i, row in enumerate(decoded) if row[2]}
+        with metrics.stage("inference"):
+            results = _score_rows(submitted)
+
+        for i, (name, image_key, ok, cached, error) in enumerate(decoded):
+            if error is not None:
+                yield name, {"error": error}
+            elif cached is not None:
+                yield name, cached
+            else:
+                result = results[i]
+                if "error" not in result:
+                    _, route, row_runtime = submitted[i]
+                    store_result(image_key, row_runtime, route, result)
+                    if route.kind != "specialist":
+                        models.record_result(row_runtime, result)
+                yield name, result
+
+        buffer, pending, runtime = next_buffer, next_pending, next_runtime
+
+# Wait for the submitted rows and score them, one scoring pass per route
+def _score_rows(submitted):
+    results, groups = {}, {}
+    for i, (future, route, _) in submitted.items():
+        try:
+            scores = future.result()
+        except Exception as e:
+            results[i] = {"error": str(e)}
+            continue
+        group = groups.setdefault((route.kind, route.crop), (route, [], []))
+        group[1].append(i)
+        group[2].append(scores)
+    for route, rows, scores in groups.values():
+        scored = scorer.results(np.stack(scores), route.mask, route.min_mass, route.temperature)
+        results.update(zip(rows, scored))
+    return results
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+# Build the model manager and prediction cache. Config comes from the environment:
+#   MODEL_BACKEND        keras (default), tflite or onnx
+#   MODEL_PATH           model artifact, defaults to the backend's file in model/
+#   MODEL_NUM_THREADS    intra-op threads for the backend
+#   MODEL_WATCH_INTERVAL seconds between checks for a replaced artifact (0 = no hot reload)
+#   MODEL_CANDIDATE_PATH second model version to serve side by side (see model_manager.py)
+#   MODEL_CANDIDATE_WEIGHT share of /predict traffic the candidate answers, 0 to 1
+#   MODEL_SHADOW         1 to also send primary-served requests to the candidate, recording only
+#   BATCH_MAX_SIZE       most images per forward pass
+#   BATCH_MAX_WAIT_MS    longest an image waits for a batch to fill
+#   BATCH_MAX_QUEUE      images allowed to wait for a batch before requests get 429 (0 = unbounded)
+#   WARMUP_BATCH_SIZES   dummy batch sizes run before reporting ready (default: powers of two up to BATCH_MAX_SIZE)
+#   PRELOAD_MODEL        1 to share the tflite weights across gunicorn workers (see gunicorn.conf.py)
+#   CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_DB_PATH  prediction cache
+#   CACHE_DB_MAX_ENTRIES rows kept in the CACHE_DB_PATH tier
+#   SPECIALIST_MEMORY_MB budget for loaded per-crop specialists (see crops.py)
+def setup():
+    global models, cache, specialists
+
+    backend_name = os.environ.get("MODEL_BACKEND", "keras")
+    batch_max_size = int(os.environ.get("BATCH_MAX_SIZE", "16"))
+    batch_max_wait_ms = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+    batch_max_queue = int(os.environ.get("BATCH_MAX_QUEUE", "0"))
+    threads = os.environ.get("MODEL_NUM_THREADS")
+    num_threads = int(threads) if threads else None
+    warmup_batch_sizes = _int_list(
+        os.environ.get("WARMUP_BATCH_SIZES", ",".join(map(str, batch_buckets(batch_max_size))))
+    )
+
+    def create_runtime(model_path):
+        return ModelRuntime(
+            backend_name=backend_name,
+            model_path=model_path,
+            num_threads=num_threads,
+            batch_max_size=batch_max_size,
+            batch_max_wait_ms=batch_max_wait_ms,
+            batch_max_queue=batch_max_queue,
+            warmup_batch_sizes=warmup_batch_sizes,
+        )
+
+    models = ModelManager(
+        create_runtime,
+        os.environ.get("MODEL_PATH") or DEFAULT_MODEL_PATHS[backend_name],
+        candidate_path=os.environ.get("MODEL_CANDIDATE_PATH") or None,
+        candidate_weight=float(os.environ.get("MODEL_CANDIDATE_WEIGHT", "0")),
+        shadow=os.environ.get("MODEL_SHADOW") == "1",
+        watch_interval=float(os.environ.get("MODEL_WATCH_INTERVAL", "2")),
+        on_swap=lambda old, new: cache.retain_model_versions(models.versions()),
+    )
+
+    # Cache results by image content. Keys carry the model version; the
+    # version of the cache itself changes with the labels and scoring config.
+    cache = PredictionCache(
+        [CLASS_INDICES_PATH, THRESHOLDS_PATH, CALIBRATION_PATH, SPECIALIST_DIR],
+        max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "2048")),
+        ttl_seconds=float(os.environ.get("CACHE_TTL_SECONDS", "86400")),
+        db_path=os.environ.get("CACHE_DB_PATH") or None,
+        disk_max_entries=int(os.environ.get("CACHE_DB_MAX_ENTRIES", "100000")),
+    )
+    # Rows of model versions served before a restart are never looked up again
+    cache.retain_model_versions(models.versions())
+
+    # Loaded on first use by requests with a crop hint, batched like the full model
+    specialists = SpecialistRegistry(
+        backend_name, CLASS_LABELS, crop_index,
+        memory_budget_mb=float(os.environ.get("SPECIALIST_MEMORY_MB", "256")),
+        num_threads=num_threads,
+        scheduler_options={
+            "max_batch_size": batch_max_size,
+            "max_wait_ms": batch_max_wait_ms,
+            "max_queue_size": batch_max_queue,
+        },
+    )
+    metrics.register_service(lambda: models, lambda: cache)
+
+    # With preloading, gunicorn's post_fork hook starts the models in each worker
+    if os.environ.get("PRELOAD_MODEL") == "1":
+        models.preload()
+    else:
+        models.start()
@@ -0,0 +1,89 @@
+import io
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+# The stand-in numpy model as the "standin" backend; it reads the class count
+# from model/class_indices.json, so tests using it run from the repo root
+@pytest.fixture
+def standin(monkeypatch):
+    import standin
+
+    monkeypatch.chdir(ROOT)
+    standin.register()
+    return standin
+
+
+# Both servers in-process, serving the stand-in model. Service config is
+# read from the environment at import, so this is set up once per session.
+@pytest.fixture(scope="session")
+def servers(tmp_path_factory):
+    import standin
+
+    os.chdir(ROOT)
+    os.environ.update(MODEL_BACKEND="standin", MODEL_WATCH_INTERVAL="0")
+    standin.register()
+
+    import app
+    import asgi
+    import service
+    from uploads import UploadStore
+
+    service.upload_store = UploadStore(str(tmp_path_factory.mktemp("uploads")))
+    assert service.models.ready.wait(10)
+    return app, asgi
+
+
+@pytest.fixture
+def flask_client(servers):
+    return servers[0].app.test_client()
+
+
+@pytest.fixture
+def asgi_client(servers):
+    from starlette.testclient import TestClient
+
+    return TestClient(servers[1].app, raise_server_exceptions=False)
+
+
+# Builds a small random JPEG; different seeds give different cache keys
+@pytest.fixture
+def jpeg():
+    import numpy as np
+    from PIL import Image
+
+    def build(seed=0, size=(64, 48)):
+        pixels = np.random.default_rng(seed).integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG")
+        return buffer.getvalue()
+
+    return build
+
+
+# Builds a zip of {name: bytes}; with corrupt=True its central directory is
+# damaged while the end record stays intact, so zipfile.is_zipfile still
+# accepts it
+@pytest.fixture
+def archive():
+    import struct
+    import zipfile
+
+    def build(members, corrupt=False):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        data = bytearray(buffer.getvalue())
+        if corrupt:
+            directory_offset = struct.unpack("<I", data[-6:-2])[0]
+            data[directory_offset:directory_offset + 4] = b"XXXX"
+        return bytes(data)
+
+    return build
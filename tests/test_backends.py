@@ -0,0 +1,102 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from backends import batch_buckets, load_backend
+from runtime import ModelRuntime
+
+
+class FakeInterpreter:
+    # Stands in for the TFLite interpreter: its output is the first three
+    # input values of each row, and it counts tensor allocations by size
+    allocations = []
+    built = []
+
+    def __init__(self, model_path=None, model_content=None, num_threads=None, experimental_op_resolver_type=None):
+        self.shape = [1, 8, 8, 3]
+        self.built.append((model_content, experimental_op_resolver_type))
+
+    def allocate_tensors(self):
+        self.allocations.append(self.shape[0])
+
+    def get_input_details(self):
+        return [{"index": 0, "shape": np.array(self.shape), "dtype": np.float32}]
+
+    def get_output_details(self):
+        return [{"index": 1, "dtype": np.float32}]
+
+    def resize_tensor_input(self, index, shape):
+        self.shape = list(shape)
+
+    def set_tensor(self, index, value):
+        assert value.shape[0] == self.shape[0]
+        self.value = value
+
+    def invoke(self):
+        self.output = self.value.reshape(len(self.value), -1)[:, :3]
+
+    def get_tensor(self, index):
+        return self.output
+
+
+@pytest.fixture
+def tflite(monkeypatch):
+    module = types.ModuleType("tflite_runtime.interpreter")
+    module.Interpreter = FakeInterpreter
+    module.OpResolverType = types.SimpleNamespace(BUILTIN_WITHOUT_DEFAULT_DELEGATES="builtin")
+    monkeypatch.setitem(sys.modules, "tflite_runtime", types.ModuleType("tflite_runtime"))
+    monkeypatch.setitem(sys.modules, "tflite_runtime.interpreter", module)
+    monkeypatch.setattr(FakeInterpreter, "allocations", [])
+    monkeypatch.setattr(FakeInterpreter, "built", [])
+    return FakeInterpreter
+
+
+def test_batch_buckets_are_powers_of_two_up_to_the_largest_batch():
+    assert batch_buckets(1) == (1,)
+    assert batch_buckets(16) == (1, 2, 4, 8, 16)
+    assert batch_buckets(12) == (1, 2, 4, 8, 12)
+
+
+def test_tflite_pads_batches_to_the_next_bucket(tflite):
+    backend = load_backend("tflite", "model.tflite", batch_sizes=batch_buckets(16))
+    for size in (1, 3, 5, 16, 7, 2, 20, 40):
+        batch = np.random.default_rng(size).random((size, 8, 8, 3), dtype=np.float32)
+        output = backend.predict(batch)
+        np.testing.assert_array_equal(output, batch.reshape(size, -1)[:, :3])
+
+    # One allocation per bucket used, however often it is used
+    assert sorted(tflite.allocations) == [1, 2, 4, 8, 16]
+
+
+def test_tflite_without_buckets_keeps_one_interpreter_per_size(tflite):
+    backend = load_backend("tflite", "model.tflite")
+    for size in (3, 3, 5, 3):
+        backend.predict(np.zeros((size, 8, 8, 3), dtype=np.float32))
+    assert sorted(tflite.allocations) == [1, 3, 5]
+
+
+def test_preloaded_tflite_interpreters_use_the_shared_bytes_without_xnnpack(tflite):
+    content = b"model bytes"
+    backend = load_backend("tflite", "model.tflite", content=content, batch_sizes=(1, 2))
+    backend.predict(np.zeros((2, 8, 8, 3), dtype=np.float32))
+
+    assert len(tflite.built) == 2
+    for model_content, resolver in tflite.built:
+        assert model_content is content
+        assert resolver == "builtin"
+
+
+def test_tflite_from_a_path_keeps_the_default_delegates(tflite):
+    load_backend("tflite", "model.tflite")
+    assert tflite.built == [(None, None)]
+
+
+def test_only_tflite_is_preloaded(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"weights")
+    for backend_name, preloaded in (("tflite", b"weights"), ("onnx", None), ("keras", None)):
+        runtime = ModelRuntime(backend_name, str(path))
+        runtime.preload()
+        assert runtime.model_content == preloaded
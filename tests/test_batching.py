@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from batching import BatchScheduler
+
+
+class RecordingModel:
+    # Doubles its input and records each batch size; with `gate`, every
+    # forward pass waits for the gate to open
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.batch_sizes = []
+        self.running = threading.Event()
+
+    def __call__(self, batch):
+        self.running.set()
+        if self.gate is not None:
+            assert self.gate.wait(5)
+        self.batch_sizes.append(len(batch))
+        return batch * 2
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_full_batch_is_dispatched_without_waiting_for_the_deadline():
+    model = RecordingModel()
+    scheduler = BatchScheduler(model, max_batch_size=4, max_wait_ms=5000)
+    started_at = time.monotonic()
+    futures = [scheduler.submit(np.full(3, i, dtype=np.float32)) for i in range(4)]
+
+    results = [future.result(5) for future in futures]
+    assert time.monotonic() - started_at < 1.0
+    assert model.batch_sizes == [4]
+    for i, result in enumerate(results):
+        np.testing.assert_array_equal(result, np.full(3, 2 * i))
+    scheduler.close()
+
+
+def test_partial_batch_is_dispatched_at_the_deadline():
+    model = RecordingModel()
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait_ms=50)
+    started_at = time.monotonic()
+
+    result = scheduler.predict(np.ones(2, dtype=np.float32), timeout=5)
+    np.testing.assert_array_equal(result, [2, 2])
+    assert time.monotonic() - started_at >= 0.045
+    assert model.batch_sizes == [1]
+    assert scheduler.stats()["batch_size"]["count"] == 1
+    scheduler.close()
+
+
+def test_samples_queued_while_busy_are_batched_together():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    scheduler = BatchScheduler(model, max_batch_size=16, max_wait_ms=0)
+    first = scheduler.submit(np.zeros(1))
+    assert model.running.wait(5)
+    rest = [scheduler.submit(np.zeros(1)) for _ in range(5)]
+
+    gate.set()
+    for future in [first] + rest:
+        future.result(5)
+    assert model.batch_sizes == [1, 5]
+    scheduler.close()
+
+
+def test_model_error_fails_every_sample_of_the_batch():
+    def broken(batch):
+        raise RuntimeError("boom")
+
+    scheduler = BatchScheduler(broken, max_batch_size=2, max_wait_ms=1000)
+    futures = [scheduler.submit(np.zeros(1)) for _ in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="boom"):
+            future.result(5)
+
+    # The worker keeps going after a failed batch
+    scheduler.predict_fn = RecordingModel()
+    np.testing.assert_array_equal(scheduler.predict(np.ones(1), timeout=5), [2])
+    scheduler.close()
+
+
+def test_close_drains_queued_samples_then_stops():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    scheduler = BatchScheduler(model, max_batch_size=2, max_wait_ms=0)
+    futures = [scheduler.submit(np.full(1, i)) for i in range(5)]
+    assert model.running.wait(5)
+    scheduler.close()
+
+    gate.set()
+    assert [future.result(5)[0] for future in futures] == [0, 2, 4, 6, 8]
+    scheduler._worker.join(5)
+    assert not scheduler._worker.is_alive()
+
+
+def test_bounded_queue_rejects_submits_once_full():
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    scheduler = BatchScheduler(model, max_batch_size=1, max_wait_ms=0, max_queue_size=2)
+    running = scheduler.submit(np.zeros(1))
+    assert model.running.wait(5)
+    wait_until(lambda: scheduler.stats()["queue_depth"] == 0)
+
+    queued = [scheduler.submit(np.zeros(1)) for _ in range(2)]
+    assert scheduler.full()
+    with pytest.raises(queue.Full):
+        scheduler.submit(np.zeros(1))
+
+    gate.set()
+    for future in [running] + queued:
+        future.result(5)
+    assert not scheduler.full()
+    scheduler.close()
+
+
+def test_invalid_settings_are_rejected():
+    with pytest.raises(ValueError):
+        BatchScheduler(RecordingModel(), max_batch_size=0)
+    with pytest.raises(ValueError):
+        BatchScheduler(RecordingModel(), max_wait_ms=-1)
@@ -0,0 +1,170 @@
+import sqlite3
+import time
+
+import pytest
+
+import cache
+from cache import PredictionCache, content_digest
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"v1")
+    return path
+
+
+def rows(db_path):
+    with sqlite3.connect(db_path) as db:
+        return sorted(key for (key,) in db.execute("SELECT key FROM predictions"))
+
+
+def test_key_is_version_and_content_digest(model_file):
+    predictions = PredictionCache([model_file])
+    assert predictions.key(b"image") == f"{predictions.version}:{content_digest(b'image')}"
+
+
+def test_memory_hit_and_miss(model_file):
+    predictions = PredictionCache([model_file])
+    key = predictions.key(b"image")
+    assert predictions.get(key) is None
+    predictions.put(key, {"class": "a"})
+
+    assert predictions.get(key) == {"class": "a"}
+    stats = predictions.stats()
+    assert (stats["memory_hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def test_least_recently_used_entry_is_evicted(model_file):
+    predictions = PredictionCache([model_file], max_entries=2)
+    a, b, c = (predictions.key(data) for data in (b"a", b"b", b"c"))
+    predictions.put(a, {"class": "a"})
+    predictions.put(b, {"class": "b"})
+    predictions.get(a)
+    predictions.put(c, {"class": "c"})
+
+    assert predictions.get(b) is None
+    assert predictions.get(a) == {"class": "a"}
+    assert predictions.get(c) == {"class": "c"}
+    assert predictions.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl(model_file):
+    predictions = PredictionCache([model_file], ttl_seconds=0.02)
+    key = predictions.key(b"image")
+    predictions.put(key, {"class": "a"})
+    time.sleep(0.05)
+
+    assert predictions.get(key) is None
+    assert predictions.stats()["expirations"] == 1
+
+
+def test_changed_model_file_invalidates_entries(model_file, monkeypatch):
+    monkeypatch.setattr(cache, "VERSION_CHECK_INTERVAL", 0.0)
+    predictions = PredictionCache([model_file])
+    old_key = predictions.key(b"image")
+    predictions.put(old_key, {"class": "a"})
+
+    model_file.write_bytes(b"version 2")
+    new_key = predictions.key(b"image")
+    assert new_key != old_key
+    assert predictions.get(old_key) is None
+    assert predictions.stats()["invalidations"] == 1
+
+    # A result computed by the old model is not stored under the new version
+    predictions.put(old_key, {"class": "a"})
+    assert predictions.stats()["entries"] == 0
+
+
+def test_disk_tier_is_shared_between_instances(model_file, tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    first = PredictionCache([model_file], db_path=db_path)
+    key = first.key(b"image")
+    first.put(key, {"class": "a"})
+
+    second = PredictionCache([model_file], db_path=db_path)
+    assert second.get(key) == {"class": "a"}
+    assert second.get(key) == {"class": "a"}
+    stats = second.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_expired_disk_row_is_deleted_on_lookup(model_file, tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    first = PredictionCache([model_file], ttl_seconds=0.02, db_path=db_path)
+    key = first.key(b"image")
+    first.put(key, {"class": "a"})
+    time.sleep(0.05)
+
+    second = PredictionCache([model_file], db_path=db_path)
+    assert second.get(key) is None
+    assert second.stats()["disk_expirations"] == 1
+    assert rows(db_path) == []
+
+
+def test_sweep_caps_the_disk_tier(model_file, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "DISK_SWEEP_INTERVAL", 0.0)
+    db_path = str(tmp_path / "cache.db")
+    predictions = PredictionCache([model_file], db_path=db_path, disk_max_entries=2)
+    keys = [predictions.key(bytes([i])) for i in range(4)]
+    for key in keys:
+        predictions.put(key, {"class": "a"})
+
+    # The rows closest to expiry, i.e. the oldest, go first
+    assert rows(db_path) == sorted(keys[2:])
+    assert predictions.stats()["disk_evictions"] == 2
+
+
+def test_sweep_deletes_expired_rows(model_file, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "cache.db")
+    predictions = PredictionCache([model_file], ttl_seconds=0.02, db_path=db_path)
+    predictions.put(predictions.key(b"old"), {"class": "a"})
+    time.sleep(0.05)
+
+    monkeypatch.setattr(cache, "DISK_SWEEP_INTERVAL", 0.0)
+    predictions.ttl = 60.0
+    fresh = predictions.key(b"fresh")
+    predictions.put(fresh, {"class": "a"})
+    assert rows(db_path) == [fresh]
+    assert predictions.stats()["disk_expirations"] == 1
+
+
+def test_clear_empties_both_tiers(model_file, tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    predictions = PredictionCache([model_file], db_path=db_path)
+    key = predictions.key(b"image")
+    predictions.put(key, {"class": "a"})
+    predictions.clear()
+
+    assert predictions.get(key) is None
+    assert rows(db_path) == []
+
+
+def test_rows_of_model_versions_no_longer_served_are_deleted(model_file, tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    predictions = PredictionCache([model_file], db_path=db_path)
+    keys = {version: predictions.key(version.encode()) for version in ("old", "primary", "candidate")}
+    for version, key in keys.items():
+        predictions.put(key, {"class": "a"}, version)
+    unversioned = predictions.key(b"unversioned")
+    predictions.put(unversioned, {"class": "a"})
+
+    predictions.retain_model_versions(["primary", "candidate"])
+    assert rows(db_path) == sorted([keys["primary"], keys["candidate"]])
+    assert predictions.stats()["disk_invalidations"] == 2
+
+
+def test_table_without_model_versions_is_upgraded(model_file, tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    with sqlite3.connect(db_path) as db:
+        db.execute(
+            "CREATE TABLE predictions (key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+            "result TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute("INSERT INTO predictions VALUES ('stale', 'v', '{}', ?)", (time.time() + 60,))
+
+    predictions = PredictionCache([model_file], db_path=db_path)
+    key = predictions.key(b"image")
+    predictions.put(key, {"class": "a"}, "current")
+    predictions.retain_model_versions(["current"])
+    assert rows(db_path) == [key]
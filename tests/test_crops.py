@@ -0,0 +1,39 @@
+import pytest
+
+from crops import CropIndex, crop_key
+from scoring import UNKNOWN_CLASS, Scorer
+
+LABELS = {
+    "0": "Apple___Apple_scab",
+    "1": "Apple___healthy",
+    "2": "Corn_(maize)___Common_rust_",
+    "3": "Corn_(maize)___healthy",
+    "4": "Pepper,_bell___healthy",
+}
+
+
+def test_crop_mask_renormalises_and_hides_other_crops():
+    index = CropIndex(LABELS)
+    assert index.classes == {"apple": [0, 1], "corn": [2, 3], "pepper": [4]}
+    scorer = Scorer(LABELS, k=5)
+
+    [result] = scorer.results([[0.1, 0.3, 0.6, 0.0, 0.0]], mask=index.masks["apple"])
+    assert result["class"] == "Apple___healthy"
+    assert result["confidence"] == 75.0
+    assert [alternative["class"] for alternative in result["top_k"]] == ["Apple___healthy", "Apple___Apple_scab"]
+
+    # Too little of the probability on the crop's classes
+    [result] = scorer.results([[0.1, 0.3, 0.6, 0.0, 0.0]], mask=index.masks["apple"], min_mass=0.5)
+    assert result["class"] == UNKNOWN_CLASS
+
+
+def test_crop_index_parses_hints_and_keeps_the_unknown_class():
+    assert crop_key("Corn_(maize)___Common_rust_") == "corn"
+    assert crop_key("Pepper,_bell___healthy") == "pepper"
+
+    index = CropIndex({**LABELS, "5": "unknown"})
+    assert index.classes["pepper"] == [4, 5]
+    assert index.parse({"crop": "Corn"}) == "corn"
+    assert index.parse({}) is None
+    with pytest.raises(ValueError):
+        index.parse({"crop": "banana"})
@@ -0,0 +1,112 @@
+import io
+import json
+
+import pytest
+
+import service
+from diseases import DEFAULTS, FIELDS, DiseaseIndex, parse_fields
+
+LABELS = {"0": "Tomato___Late_blight", "1": "Tomato___healthy"}
+INFO = {
+    "Tomato___Late_blight": {field: f"blight {field} ü" for field in FIELDS},
+    "unknown": {"cause": "Not a known leaf."},
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = tmp_path / "disease_info.json"
+    path.write_text(json.dumps(INFO), encoding="utf-8")
+    return DiseaseIndex(str(path), LABELS)
+
+
+def test_render_splices_the_details_into_the_result(index):
+    result = {"class": "Tomato___Late_blight", "confidence": 91.5, "top_k": [{"class": "x", "confidence": 1.0}]}
+    rendered = json.loads(index.render(result, prefix={"file": "a.jpg"}))
+
+    assert rendered == {"file": "a.jpg", **result, **INFO["Tomato___Late_blight"]}
+    assert list(rendered)[:3] == ["file", "class", "confidence"]
+
+
+def test_render_selects_fields(index):
+    result = {"class": "Tomato___Late_blight", "confidence": 91.5}
+    assert json.loads(index.render(result, ())) == result
+    assert json.loads(index.render(result, ("care",))) == {**result, "care": "blight care ü"}
+
+
+def test_render_fills_in_defaults_and_passes_errors_through(index):
+    assert json.loads(index.render({"class": "Tomato___healthy", "confidence": 80.0})) == {
+        "class": "Tomato___healthy", "confidence": 80.0, **DEFAULTS,
+    }
+    assert json.loads(index.render({"class": "unknown", "confidence": 20.0}, ("cause",)))["cause"] == (
+        "Not a known leaf."
+    )
+    assert json.loads(index.render({"error": "bad image"}, prefix={"file": "a.jpg"})) == {
+        "file": "a.jpg", "error": "bad image",
+    }
+
+
+def test_entries_are_found_by_name_or_id(index):
+    assert index.get("0") is index.get("Tomato___Late_blight")
+    assert index.get(1).name == "Tomato___healthy"
+    assert index.get("unknown").class_id is None
+    assert index.get("7") is None
+
+
+def test_parse_fields():
+    assert parse_fields({}) is None
+    assert parse_fields({"lite": "1"}) == ()
+    assert parse_fields({"fields": "cause, care"}) == ("cause", "care")
+    with pytest.raises(ValueError):
+        parse_fields({"fields": "cause,price"})
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def get(request, flask_client, asgi_client):
+    client = flask_client if request.param == "flask" else asgi_client
+
+    def get(path, headers=None):
+        response = client.get(path, headers=headers or {})
+        body = response.data if request.param == "flask" else response.content
+        return response.status_code, response.headers, body
+
+    return get
+
+
+def test_disease_details_are_cached_by_etag(get):
+    name = service.CLASS_LABELS["0"]
+    status, headers, body = get(f"/diseases/{name}")
+    assert status == 200
+    assert json.loads(body)["class"] == name
+    assert "max-age" in headers["Cache-Control"]
+    etag = headers["ETag"]
+
+    assert get("/diseases/0")[2] == body
+    status, headers, body = get(f"/diseases/{name}", {"If-None-Match": etag})
+    assert (status, body) == (304, b"")
+    assert headers["ETag"] == etag
+    assert get(f"/diseases/{name}", {"If-None-Match": '"other"'})[0] == 200
+    assert get("/diseases/no_such_class")[0] == 404
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def predict(request, flask_client, asgi_client):
+    def predict(data, query=""):
+        if request.param == "flask":
+            response = flask_client.post("/predict" + query, data={"file": (io.BytesIO(data), "a.jpg")})
+            return response.status_code, response.data
+        response = asgi_client.post("/predict" + query, files={"file": ("a.jpg", data)})
+        return response.status_code, response.content
+
+    return predict
+
+
+def test_predict_can_leave_out_the_details(predict, jpeg):
+    full = json.loads(predict(jpeg())[1])
+    assert set(FIELDS) <= set(full)
+
+    status, body = predict(jpeg(), "?lite=1")
+    assert status == 200
+    assert json.loads(body) == {"class": full["class"], "confidence": full["confidence"]}
+    assert set(json.loads(predict(jpeg(), "?fields=care")[1])) == {"class", "confidence", "care"}
+    assert predict(jpeg(), "?fields=price")[0] == 400
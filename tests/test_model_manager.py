@@ -0,0 +1,84 @@
+import time
+
+import numpy as np
+import pytest
+
+from model_manager import ModelManager
+from preprocess import IMG_SIZE
+from runtime import ModelRuntime
+
+IMAGE = np.zeros((IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def swaps():
+    return []
+
+
+@pytest.fixture
+def manager(standin, tmp_path, swaps):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"v1")
+    manager = ModelManager(
+        lambda model_path: ModelRuntime("standin", model_path, batch_max_wait_ms=0),
+        str(path), watch_interval=0, on_swap=lambda old, new: swaps.append((old, new)),
+    )
+    manager.start()
+    assert manager.ready.wait(5)
+    yield manager
+    manager.primary.close()
+
+
+def test_changed_artifact_is_swapped_in_once_it_is_stable(manager, tmp_path, swaps):
+    old = manager.primary
+    (tmp_path / "model.bin").write_bytes(b"version 2")
+
+    # The first poll only notes the change, in case the file is still being written
+    manager._check("primary")
+    assert manager.primary is old and not manager._loading
+    manager._check("primary")
+    wait_until(lambda: manager.swaps == 1)
+
+    assert manager.primary is not old
+    assert manager.primary.version != old.version
+    wait_until(lambda: swaps)
+    assert swaps == [(old, manager.primary)]
+    assert manager.versions() == [manager.primary.version]
+    assert old.retired
+    old.scheduler._worker.join(5)
+    assert not old.scheduler._worker.is_alive()
+
+
+def test_submit_to_a_retired_runtime_goes_to_its_replacement(manager, tmp_path):
+    old = manager.primary
+    (tmp_path / "model.bin").write_bytes(b"version 2")
+    manager._check("primary")
+    manager._check("primary")
+    wait_until(lambda: manager.swaps == 1)
+
+    future, runtime = manager.submit(IMAGE, old)
+    assert runtime is manager.primary
+    assert future.result(5).shape == (runtime.model.w2.shape[1],)
+    versions = {stats["version"] for stats in manager.stats()}
+    assert versions == {old.version, runtime.version}
+
+
+def test_failed_load_keeps_serving_and_is_not_retried(manager, tmp_path, monkeypatch):
+    old = manager.primary
+    monkeypatch.setattr(ModelRuntime, "load", lambda runtime: setattr(runtime, "error", "broken"))
+    (tmp_path / "model.bin").write_bytes(b"broken")
+    manager._check("primary")
+    manager._check("primary")
+    wait_until(lambda: not manager._loading)
+
+    assert manager.primary is old and manager.swaps == 0
+    manager._check("primary")
+    manager._check("primary")
+    assert not manager._loading
@@ -0,0 +1,72 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import preprocess
+from preprocess import IMG_SIZE, ImageTooLarge, decode_image, decoded_bytes, preprocess_image
+
+
+def encode(img, image_format):
+    buffer = io.BytesIO()
+    img.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def test_image_is_preprocessed_to_the_model_input(jpeg):
+    array = preprocess_image(jpeg())
+    assert array.shape == (IMG_SIZE[1], IMG_SIZE[0], 3)
+    assert array.dtype == np.float32
+    assert 0.0 <= array.min() and array.max() <= 1.0
+
+
+def test_file_uploads_match_bytes_and_fill_the_given_buffer(jpeg):
+    data = jpeg()
+    out = np.empty((IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.float32)
+    upload = io.BytesIO(data)
+    upload.seek(7)
+
+    assert preprocess_image(upload, out=out) is out
+    np.testing.assert_array_equal(out, preprocess_image(data))
+
+
+def test_other_modes_are_converted_to_rgb():
+    for mode in ("RGBA", "P", "L"):
+        data = encode(Image.new(mode, (40, 30)), "PNG")
+        assert preprocess_image(data).shape == (IMG_SIZE[1], IMG_SIZE[0], 3)
+
+
+def test_upload_over_the_byte_limit_is_rejected(jpeg, monkeypatch):
+    data = jpeg()
+    monkeypatch.setattr(preprocess, "MAX_IMAGE_BYTES", len(data) - 1)
+    with pytest.raises(ImageTooLarge):
+        preprocess_image(data)
+    with pytest.raises(ImageTooLarge):
+        preprocess_image(io.BytesIO(data))
+
+
+def test_pixel_bomb_is_rejected_from_its_header():
+    # Compresses to a few KB but declares 25 megapixels
+    data = encode(Image.new("L", (5000, 5000)), "PNG")
+    assert len(data) < 100_000
+    with pytest.raises(ImageTooLarge, match="pixels"):
+        decode_image(io.BytesIO(data), max_pixels=10_000_000)
+
+
+def test_bitmap_over_the_decode_limit_is_rejected():
+    data = encode(Image.new("RGB", (600, 400)), "PNG")
+    with pytest.raises(ImageTooLarge, match="Decoding"):
+        decode_image(io.BytesIO(data), max_bytes=600 * 400 * 3 - 1)
+    assert decode_image(io.BytesIO(data), max_bytes=600 * 400 * 3).size == (600, 400)
+
+
+def test_jpeg_is_scaled_down_while_decoding():
+    data = encode(Image.new("RGB", (2048, 1536), (120, 200, 40)), "JPEG")
+    img = decode_image(io.BytesIO(data))
+
+    # libjpeg scales by 1/8 at most, staying at least the target size
+    assert img.size == (256, 192)
+    assert decoded_bytes(img) == 256 * 192 * 3
+    # So a full-size bitmap over the limit still decodes
+    assert decode_image(io.BytesIO(data), max_bytes=256 * 192 * 3).size == (256, 192)
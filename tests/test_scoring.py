@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from scoring import UNKNOWN_CLASS, Scorer, apply_temperature, fit_temperature, parse_top_k, select_top_k
+
+LABELS = {
+    "0": "Apple___Apple_scab",
+    "1": "Apple___healthy",
+    "2": "Corn_(maize)___Common_rust_",
+    "3": "Corn_(maize)___healthy",
+    "4": "Pepper,_bell___healthy",
+}
+
+
+def test_best_class_above_its_threshold_is_served():
+    scorer = Scorer(LABELS, k=3)
+    [result] = scorer.results([[0.05, 0.8, 0.1, 0.03, 0.02]])
+
+    assert result["class"] == "Apple___healthy"
+    assert result["confidence"] == 80.0
+    assert [alternative["class"] for alternative in result["top_k"]] == [
+        "Apple___healthy", "Corn_(maize)___Common_rust_", "Apple___Apple_scab",
+    ]
+
+
+def test_per_class_threshold_falls_back_to_unknown():
+    scorer = Scorer(LABELS, thresholds=[70, 90, 70, 70, 70])
+    results = scorer.results([[0.05, 0.8, 0.1, 0.03, 0.02], [0.8, 0.05, 0.1, 0.03, 0.02]])
+
+    assert [result["class"] for result in results] == [UNKNOWN_CLASS, "Apple___Apple_scab"]
+    # The model's guesses are still listed
+    assert results[0]["top_k"][0]["class"] == "Apple___healthy"
+
+
+def test_model_unknown_class_always_falls_back():
+    scorer = Scorer({"0": "Apple___healthy", "1": "unknown"})
+    [result] = scorer.results([[0.01, 0.99]])
+    assert result["class"] == UNKNOWN_CLASS
+
+
+def test_temperature_is_fitted_to_overconfident_scores():
+    rng = np.random.default_rng(0)
+    logits = rng.normal(0, 2, size=(20000, 5))
+    true_scores = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+    labels = np.array([rng.choice(5, p=row) for row in true_scores])
+    overconfident = apply_temperature(true_scores, 1 / 3)
+
+    assert fit_temperature(overconfident, labels) == pytest.approx(3.0, rel=0.1)
+    assert fit_temperature(true_scores, labels) == pytest.approx(1.0, rel=0.1)
+
+
+def test_top_k_selection_and_parsing():
+    result = {"class": "a", "confidence": 90.0, "top_k": [{"class": "a"}, {"class": "b"}]}
+    assert select_top_k(result, 0) == {"class": "a", "confidence": 90.0}
+    assert select_top_k(result, 1)["top_k"] == [{"class": "a"}]
+    assert parse_top_k({}) == 0
+    assert parse_top_k({"top_k": "2"}) == 2
+    with pytest.raises(ValueError):
+        parse_top_k({"top_k": "99"})
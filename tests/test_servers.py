@@ -0,0 +1,94 @@
+import io
+import json
+
+import pytest
+
+import service
+
+
+def flask_batch(client, files, query=""):
+    response = client.post(
+        "/predict/batch" + query, data={"files": [(io.BytesIO(data), name) for name, data in files]}
+    )
+    return response.status_code, response.data
+
+
+def asgi_batch(client, files, query=""):
+    response = client.post("/predict/batch" + query, files=[("files", (name, data)) for name, data in files])
+    return response.status_code, response.content
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def batch(request, flask_client, asgi_client):
+    if request.param == "flask":
+        return lambda files, query="": flask_batch(flask_client, files, query)
+    return lambda files, query="": asgi_batch(asgi_client, files, query)
+
+
+def lines(body):
+    return [json.loads(line) for line in body.decode().splitlines()]
+
+
+def test_batch_streams_one_line_per_image(batch, jpeg):
+    status, body = batch([("a.jpg", jpeg(1)), ("bad.jpg", b"not an image"), ("b.jpg", jpeg(2))], "?top_k=2")
+
+    assert status == 200
+    results = lines(body)
+    assert [result["file"] for result in results] == ["a.jpg", "bad.jpg", "b.jpg"]
+    assert "error" in results[1]
+    assert len(results[0]["top_k"]) == 2
+
+
+def test_batch_without_files_is_rejected(batch):
+    assert batch([])[0] == 400
+
+
+def test_batch_gets_503_until_the_model_is_ready(batch, jpeg):
+    ready = service.models.ready
+    ready.clear()
+    try:
+        assert batch([("a.jpg", jpeg())])[0] == 503
+    finally:
+        ready.set()
+
+
+def test_batch_gets_429_when_the_queue_is_full(batch, jpeg, monkeypatch):
+    monkeypatch.setattr(service.models.primary.scheduler, "full", lambda: True)
+    status, body = batch([("a.jpg", jpeg())])
+    assert status == 429
+    assert "error" in json.loads(body)
+
+
+def test_asgi_gets_429_once_too_many_requests_are_pending(servers, asgi_client, jpeg, monkeypatch):
+    asgi = servers[1]
+    monkeypatch.setattr(asgi, "pending", asgi.ASGI_MAX_PENDING)
+    assert asgi_batch(asgi_client, [("a.jpg", jpeg())])[0] == 429
+    assert asgi_client.post("/predict", files={"file": ("a.jpg", jpeg())}).status_code == 429
+
+
+def test_asgi_batch_releases_its_slot_when_the_stream_fails(servers, asgi_client, jpeg, monkeypatch):
+    asgi = servers[1]
+
+    def failing(uploads, top_k=0, crop=None):
+        for name, _ in uploads:
+            yield name, {"error": "first"}
+            raise RuntimeError("stream failed")
+
+    monkeypatch.setattr(service, "predict_many", failing)
+    pending = asgi.pending
+    for _ in range(3):
+        asgi_batch(asgi_client, [("a.jpg", jpeg()), ("b.jpg", jpeg())])
+    assert asgi.pending == pending
+
+    monkeypatch.undo()
+    assert asgi_batch(asgi_client, [("a.jpg", jpeg())])[0] == 200
+    assert asgi.pending == pending
+
+
+def test_corrupted_zip_does_not_cut_the_batch_short(batch, jpeg, archive):
+    status, body = batch([("leaves.zip", archive({"a.jpg": jpeg(1)}, corrupt=True)), ("b.jpg", jpeg(2))])
+
+    assert status == 200
+    results = lines(body)
+    assert [result["file"] for result in results] == ["leaves.zip", "b.jpg"]
+    assert "error" in results[0] and "class" in results[1]
@@ -0,0 +1,43 @@
+import io
+import zipfile
+
+import service
+
+
+def predict(files, **options):
+    return list(service.predict_many(service.iter_uploads(files), **options))
+
+
+def test_results_keep_upload_order_across_chunks(servers, jpeg, monkeypatch):
+    monkeypatch.setattr(service, "PREDICT_CHUNK_SIZE", 3)
+    files = [(f"{i}.jpg", io.BytesIO(jpeg(100 + i))) for i in range(8)]
+
+    results = predict(files, top_k=1)
+    assert [name for name, _ in results] == [f"{i}.jpg" for i in range(8)]
+    assert all("class" in result and len(result["top_k"]) == 1 for _, result in results)
+
+
+def test_zip_members_are_predicted_with_their_errors(servers, jpeg, archive, monkeypatch):
+    monkeypatch.setattr(service, "PREDICT_CHUNK_SIZE", 2)
+    images = [jpeg(1), jpeg(2)]
+    limit = max(len(image) for image in images)
+    monkeypatch.setattr(service, "MAX_IMAGE_BYTES", limit)
+    data = archive({
+        "a.jpg": images[0], "broken.jpg": b"not an image", "big.jpg": b"x" * (limit + 1), "b.jpg": images[1],
+    })
+
+    results = dict(predict([("leaves.zip", io.BytesIO(data))]))
+    assert list(results) == ["a.jpg", "broken.jpg", "big.jpg", "b.jpg"]
+    assert "class" in results["a.jpg"] and "class" in results["b.jpg"]
+    assert "error" in results["broken.jpg"]
+    assert "limit" in results["big.jpg"]["error"]
+
+
+def test_corrupted_zip_is_one_error_and_later_files_are_still_predicted(servers, jpeg, archive):
+    data = archive({"a.jpg": jpeg(1)}, corrupt=True)
+    assert zipfile.is_zipfile(io.BytesIO(data))
+
+    results = predict([("leaves.zip", io.BytesIO(data)), ("b.jpg", io.BytesIO(jpeg(2)))])
+    assert [name for name, _ in results] == ["leaves.zip", "b.jpg"]
+    assert results[0][1]["error"].startswith("Unreadable zip archive")
+    assert "class" in results[1][1]
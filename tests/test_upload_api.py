@@ -0,0 +1,129 @@
+import io
+import json
+
+import pytest
+
+import service
+import uploads
+
+
+class Client:
+    # The same requests against either server, as (status, JSON body)
+    def __init__(self, kind, client):
+        self.kind = kind
+        self.client = client
+
+    def request(self, method, path, body=None, headers=None, json_body=None):
+        if self.kind == "flask":
+            response = self.client.open(path, method=method, data=body, headers=headers, json=json_body)
+            data = response.data
+        else:
+            response = self.client.request(method, path, content=body, headers=headers, json=json_body)
+            data = response.content
+        return response.status_code, json.loads(data) if data else None
+
+    def create(self, size=None):
+        status, body = self.request("POST", "/uploads", json_body={} if size is None else {"size": size})
+        assert status == 201
+        return body["upload_id"]
+
+    def patch(self, upload_id, offset, data):
+        return self.request("PATCH", f"/uploads/{upload_id}", data, {"Upload-Offset": str(offset)})
+
+    def predict_chunked(self, body, content_type):
+        if self.kind == "flask":
+            response = self.client.post(
+                "/predict", input_stream=io.BytesIO(body), content_type=content_type,
+                headers={"Transfer-Encoding": "chunked"}, environ_overrides={"wsgi.input_terminated": True},
+            )
+            return response.status_code
+        # A generator body is sent without a Content-Length
+        chunks = (body[start:start + 1000] for start in range(0, len(body), 1000))
+        return self.client.post("/predict", content=chunks, headers={"Content-Type": content_type}).status_code
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request, flask_client, asgi_client):
+    return Client(request.param, flask_client if request.param == "flask" else asgi_client)
+
+
+def multipart(data):
+    return (
+        b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+        b"Content-Type: image/jpeg\r\n\r\n" + data + b"\r\n--b--\r\n"
+    )
+
+
+def test_resumable_upload_is_appended_and_committed(client, jpeg):
+    data = jpeg()
+    upload_id = client.create(len(data))
+    half = len(data) // 2
+
+    status, body = client.patch(upload_id, 0, data[:half])
+    assert (status, body["offset"]) == (200, half)
+    status, body = client.patch(upload_id, 0, data[half:])
+    assert (status, body["offset"]) == (409, half)
+    status, body = client.patch(upload_id, half, data[half:])
+    assert (status, body["offset"]) == (200, len(data))
+
+    status, result = client.request("POST", f"/uploads/{upload_id}/commit?lite=1")
+    assert status == 200 and set(result) == {"class", "confidence"}
+    assert client.request("GET", f"/uploads/{upload_id}")[0] == 404
+
+
+def test_incomplete_upload_cannot_be_committed(client, jpeg):
+    upload_id = client.create(100)
+    client.patch(upload_id, 0, b"x" * 10)
+    status, body = client.request("POST", f"/uploads/{upload_id}/commit")
+    assert (status, body["offset"]) == (409, 10)
+
+
+def test_append_past_the_declared_size_gets_413(client):
+    upload_id = client.create(10)
+    client.patch(upload_id, 0, b"x" * 4)
+    assert client.patch(upload_id, 4, b"x" * 7)[0] == 413
+    assert client.request("GET", f"/uploads/{upload_id}")[1]["offset"] == 4
+
+
+def test_upload_over_the_image_limit_is_refused(client):
+    assert client.request("POST", "/uploads", json_body={"size": service.upload_store.max_bytes + 1})[0] == 413
+
+
+def test_unknown_upload_gets_404(client):
+    assert client.request("GET", "/uploads/" + "0" * 32)[0] == 404
+    assert client.patch("0" * 32, 0, b"x")[0] == 404
+    assert client.request("POST", "/uploads/not-an-id/commit")[0] == 404
+
+
+def test_commit_keeps_the_upload_when_it_cannot_be_served(client, jpeg, monkeypatch):
+    # Not predicted (and cached) by another test
+    data = jpeg(seed={"flask": 501, "asgi": 502}[client.kind])
+    upload_id = client.create(len(data))
+    client.patch(upload_id, 0, data)
+
+    ready = service.models.ready
+    ready.clear()
+    try:
+        assert client.request("POST", f"/uploads/{upload_id}/commit")[0] == 503
+    finally:
+        ready.set()
+
+    def overloaded(*args):
+        raise service.Overloaded("Too many requests waiting for the model")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(service, "submit", overloaded)
+        assert client.request("POST", f"/uploads/{upload_id}/commit")[0] == 429
+    assert client.request("GET", f"/uploads/{upload_id}")[1]["offset"] == len(data)
+    assert client.request("POST", f"/uploads/{upload_id}/commit")[0] == 200
+
+
+def test_predict_body_over_the_limit_gets_413(client, jpeg, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_IMAGE_REQUEST_BYTES", 2000)
+    body = multipart(b"\0" * 3000)
+    content_type = "multipart/form-data; boundary=b"
+
+    status, _ = client.request("POST", "/predict", body, {"Content-Type": content_type})
+    assert status == 413
+    assert client.predict_chunked(body, content_type) == 413
+    assert client.request("POST", "/predict", multipart(jpeg(size=(8, 8))), {"Content-Type": content_type})[0] == 200
@@ -0,0 +1,158 @@
+import io
+import os
+
+import pytest
+
+from uploads import (
+    LimitedReader,
+    UploadConflict,
+    UploadError,
+    UploadNotFound,
+    UploadStore,
+    UploadTooLarge,
+    parse_offset,
+    parse_size,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / "uploads"), max_bytes=100, ttl_seconds=3600)
+
+
+# Yields `data`, then fails like a dropped connection
+class DroppedStream:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size=-1):
+        if self.data is None:
+            raise ConnectionResetError("connection dropped")
+        data, self.data = self.data, None
+        return data
+
+
+def test_chunks_are_appended_at_the_current_offset(store):
+    upload_id = store.create(size=6, filename="leaf.jpg")["upload_id"]
+    assert store.status(upload_id)["offset"] == 0
+
+    assert store.append(upload_id, 0, io.BytesIO(b"abc"))["offset"] == 3
+    status = store.append(upload_id, 3, io.BytesIO(b"def"))
+    assert (status["offset"], status["size"], status["filename"]) == (6, 6, "leaf.jpg")
+    with store.open(upload_id) as f:
+        assert f.read() == b"abcdef"
+
+
+def test_append_at_the_wrong_offset_conflicts(store):
+    upload_id = store.create()["upload_id"]
+    store.append(upload_id, 0, io.BytesIO(b"abc"))
+
+    for offset in (0, 5):
+        with pytest.raises(UploadConflict) as error:
+            store.append(upload_id, offset, io.BytesIO(b"x"))
+        assert error.value.offset == 3
+    assert store.status(upload_id)["offset"] == 3
+
+
+def test_concurrent_append_conflicts(store):
+    upload_id = store.create()["upload_id"]
+    with store.appending(upload_id, 0) as append:
+        append.write(b"ab")
+        with pytest.raises(UploadConflict):
+            store.appending(upload_id, 0)
+        with pytest.raises(UploadConflict):
+            store.open(upload_id)
+    assert store.append(upload_id, 2, io.BytesIO(b"c"))["offset"] == 3
+
+
+def test_dropped_connection_keeps_the_bytes_received(store):
+    upload_id = store.create(size=6)["upload_id"]
+    with pytest.raises(ConnectionResetError):
+        store.append(upload_id, 0, DroppedStream(b"abcd"))
+
+    assert store.status(upload_id)["offset"] == 4
+    store.append(upload_id, 4, io.BytesIO(b"ef"))
+    with store.open(upload_id) as f:
+        assert f.read() == b"abcdef"
+
+
+def test_append_past_the_declared_size_is_dropped(store):
+    upload_id = store.create(size=4)["upload_id"]
+    store.append(upload_id, 0, io.BytesIO(b"ab"))
+
+    with pytest.raises(UploadTooLarge):
+        store.append(upload_id, 2, io.BytesIO(b"cde"))
+    assert store.status(upload_id)["offset"] == 2
+
+
+def test_append_past_the_store_limit_is_dropped(store):
+    upload_id = store.create()["upload_id"]
+    with pytest.raises(UploadTooLarge):
+        store.append(upload_id, 0, io.BytesIO(b"x" * 101))
+    assert store.status(upload_id)["offset"] == 0
+
+
+def test_create_over_the_limit_is_refused(store):
+    with pytest.raises(UploadTooLarge):
+        store.create(size=101)
+
+
+def test_incomplete_upload_cannot_be_opened(store):
+    upload_id = store.create(size=4)["upload_id"]
+    with pytest.raises(UploadConflict):
+        store.open(upload_id)
+    store.append(upload_id, 0, io.BytesIO(b"ab"))
+    with pytest.raises(UploadConflict) as error:
+        store.open(upload_id)
+    assert error.value.offset == 2
+
+
+def test_unknown_and_malformed_ids_are_not_found(store):
+    store.create()
+    for upload_id in ("0" * 32, "../../etc/passwd"):
+        with pytest.raises(UploadNotFound):
+            store.status(upload_id)
+        with pytest.raises(UploadNotFound):
+            store.append(upload_id, 0, io.BytesIO(b"x"))
+
+
+def test_discard_removes_the_upload(store):
+    upload_id = store.create()["upload_id"]
+    store.append(upload_id, 0, io.BytesIO(b"abc"))
+    store.discard(upload_id)
+    with pytest.raises(UploadNotFound):
+        store.status(upload_id)
+    store.discard(upload_id)
+
+
+def test_untouched_uploads_expire(store):
+    stale = store.create()["upload_id"]
+    fresh = store.create()["upload_id"]
+    for name in os.listdir(store.directory):
+        if name.startswith(stale):
+            os.utime(os.path.join(store.directory, name), (0, 0))
+
+    store.expire()
+    with pytest.raises(UploadNotFound):
+        store.status(stale)
+    assert store.status(fresh)["offset"] == 0
+
+
+def test_limited_reader_stops_past_the_limit():
+    reader = LimitedReader(io.BytesIO(b"line\n" + b"x" * 10), limit=8)
+    assert reader.readline() == b"line\n"
+    with pytest.raises(UploadTooLarge):
+        reader.read()
+
+
+def test_parse_offset_and_size():
+    assert parse_offset("12") == 12
+    assert parse_size(None) is None
+    assert parse_size("") is None
+    assert parse_size(5) == 5
+    for value in (None, "-1", "1.5"):
+        with pytest.raises(UploadError):
+            parse_offset(value)
+    for value in (0, "0", True, "abc"):
+        with pytest.raises(UploadError):
+            parse_size(value)
@@ -0,0 +1,266 @@
+import fcntl
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from preprocess import MAX_IMAGE_BYTES
+
+# Largest request body accepted. Enforced while the body streams in: a
+# larger Content-Length is refused before anything is read, and a chunked
+# body is cut off once it passes the limit. /predict takes one image, so
+# its limit is the image limit plus room for the multipart headers.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+MAX_IMAGE_REQUEST_BYTES = MAX_IMAGE_BYTES + 64 * 1024
+
+# Bytes of an upload kept in memory before it spills to a temporary file
+UPLOAD_SPOOL_MEMORY = int(os.environ.get("UPLOAD_SPOOL_MEMORY", str(1024 * 1024)))
+
+# Resumable uploads (see UploadStore); untouched ones are removed after the TTL
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+UPLOAD_TTL_SECONDS = float(os.environ.get("UPLOAD_TTL_SECONDS", "86400"))
+
+COPY_CHUNK_BYTES = 64 * 1024
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+# Servers answer these with their status code
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+class UploadNotFound(UploadError):
+    status_code = 404
+
+
+# The upload is not where the client thinks it is (a chunk was lost, sent
+# twice or is still being written); `offset` is where to resume from
+class UploadConflict(UploadError):
+    status_code = 409
+
+    def __init__(self, message, offset):
+        super().__init__(message)
+        self.offset = offset
+
+
+# Request body limit for a path
+def body_limit(path):
+    return MAX_IMAGE_REQUEST_BYTES if path == "/predict" else MAX_UPLOAD_BYTES
+
+
+# Parse the Upload-Offset header of an append. Raises UploadError.
+def parse_offset(value):
+    if value is None or not value.isdigit():
+        raise UploadError("Upload-Offset header must be the number of bytes already uploaded")
+    return int(value)
+
+
+# Parse the declared total size of a new upload; None when not given. Raises UploadError.
+def parse_size(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or not str(value).isdigit() or int(value) == 0:
+        raise UploadError("size must be a positive number of bytes")
+    return int(value)
+
+
+# Bytes of an upload held in memory: all of it for bytes and BytesIO, and
+# for a tempfile.SpooledTemporaryFile until it rolls over to disk (only
+# then does it have a file name)
+def in_memory_bytes(upload, size):
+    if isinstance(upload, (bytes, bytearray, memoryview, io.BytesIO)):
+        return size
+    if isinstance(upload, tempfile.SpooledTemporaryFile) and upload.name is None:
+        return size
+    return 0
+
+
+class LimitedReader:
+    # Read-only view of a request body of unknown length (chunked) that
+    # raises UploadTooLarge once more than `limit` bytes have been read
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        return self._count(self.stream.read(size))
+
+    def readline(self, size=-1):
+        return self._count(self.stream.readline(size))
+
+    def _count(self, data):
+        self.read_bytes += len(data)
+        if self.read_bytes > self.limit:
+            raise UploadTooLarge(f"Request body is over the {self.limit} byte limit")
+        return data
+
+
+class Append:
+    # One append in progress, holding the upload's lock until closed. A
+    # chunk past the upload's size raises UploadTooLarge, and closing with
+    # that error drops the whole append; with any other (a dropped
+    # connection), whatever was written is kept for the client to resume.
+
+    def __init__(self, f, start, limit, meta_path):
+        self.f = f
+        self.start = start
+        self.limit = limit
+        self.meta_path = meta_path
+
+    def write(self, chunk):
+        if self.f.tell() + len(chunk) > self.limit:
+            raise UploadTooLarge(f"Upload is over its {self.limit} byte limit")
+        self.f.write(chunk)
+
+    def close(self, error=None):
+        try:
+            if isinstance(error, UploadTooLarge):
+                self.f.truncate(self.start)
+            # Keeps an upload that is still being appended to from expiring
+            os.utime(self.meta_path)
+        except FileNotFoundError:
+            pass
+        finally:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.close(error)
+
+
+class UploadStore:
+    # Resumable single-image uploads, spooled to files under `directory`, so
+    # a client on a poor connection continues an interrupted upload where it
+    # stopped instead of starting over:
+    #   POST   /uploads               create, {"size": total bytes} optional
+    #   GET    /uploads/<id>          {"offset": bytes received so far, ...}
+    #   PATCH  /uploads/<id>          append the body at header Upload-Offset
+    #   POST   /uploads/<id>/commit   predict, decoding straight from the file
+    #   DELETE /uploads/<id>          discard
+    # Whatever part of an append arrived before its connection dropped is
+    # kept. All state is in the files (<id>.part and <id>.json) and appends
+    # hold an flock, so any worker sharing the directory can serve any step.
+
+    def __init__(self, directory=UPLOAD_DIR, max_bytes=MAX_IMAGE_BYTES, ttl_seconds=UPLOAD_TTL_SECONDS):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl_seconds)
+
+    def create(self, size=None, filename=None):
+        if size is not None and size > self.max_bytes:
+            raise UploadTooLarge(f"Upload is {size} bytes, limit is {self.max_bytes}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+
+        upload_id = uuid.uuid4().hex
+        data_path, meta_path = self._paths(upload_id)
+        open(data_path, "xb").close()
+        meta = {"upload_id": upload_id, "size": size, "filename": filename}
+        # Written last and renamed into place: an upload exists once its metadata does
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+        return self._status(meta, 0)
+
+    def status(self, upload_id):
+        meta = self._meta(upload_id)
+        data_path, _ = self._paths(upload_id)
+        try:
+            offset = os.path.getsize(data_path)
+        except FileNotFoundError:
+            raise UploadNotFound(f"Unknown upload {upload_id!r}")
+        return self._status(meta, offset)
+
+    # Start an append at `offset`; returns an Append to write chunks to and
+    # close. Servers that receive the body asynchronously call its methods
+    # from a thread pool.
+    def appending(self, upload_id, offset):
+        meta = self._meta(upload_id)
+        data_path, meta_path = self._paths(upload_id)
+        try:
+            f = open(data_path, "r+b")
+        except FileNotFoundError:
+            raise UploadNotFound(f"Unknown upload {upload_id!r}")
+        try:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict("Another append to this upload is in progress", os.fstat(f.fileno()).st_size)
+            start = f.seek(0, os.SEEK_END)
+            if offset != start:
+                raise UploadConflict(f"Upload is at offset {start}, not {offset}", start)
+        except BaseException:
+            f.close()
+            raise
+        return Append(f, start, meta["size"] or self.max_bytes, meta_path)
+
+    # Append a readable stream at `offset`; returns the new status
+    def append(self, upload_id, offset, stream):
+        with self.appending(upload_id, offset) as append:
+            for chunk in iter(lambda: stream.read(COPY_CHUNK_BYTES), b""):
+                append.write(chunk)
+        return self.status(upload_id)
+
+    # Open a complete upload for reading; discard it once it has been used
+    def open(self, upload_id):
+        status = self.status(upload_id)
+        offset, size = status["offset"], status["size"]
+        if offset == 0 or (size is not None and offset != size):
+            raise UploadConflict(f"Upload has {offset} of {size or 'the'} bytes", offset)
+        data_path, _ = self._paths(upload_id)
+        f = open(data_path, "rb")
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            raise UploadConflict("An append to this upload is in progress", offset)
+        return f
+
+    def discard(self, upload_id):
+        data_path, meta_path = self._paths(upload_id)
+        for path in (meta_path, data_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    # Remove uploads (and leftover files) not touched for the TTL
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _paths(self, upload_id):
+        # Also keeps client-supplied IDs from naming paths outside the directory
+        if not _UPLOAD_ID.match(upload_id):
+            raise UploadNotFound(f"Unknown upload {upload_id!r}")
+        base = os.path.join(self.directory, upload_id)
+        return base + ".part", base + ".json"
+
+    def _meta(self, upload_id):
+        _, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadNotFound(f"Unknown upload {upload_id!r}")
+
+    def _status(self, meta, offset):
+        return {**meta, "offset": offset, "max_bytes": self.max_bytes}